@@ -6,10 +6,18 @@ AI Document Assistant - Command Line Interface
 import os
 import sys
 import argparse
+import asyncio
 import shlex
 import json
 import datetime
 import re
+import textwrap
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import orjson  # Faster JSON serialization when available
+except ImportError:
+    orjson = None
 from pathlib import Path
 from typing import List, Dict, Optional
 
@@ -17,8 +25,54 @@ from typing import List, Dict, Optional
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from core.rag_chain import deep_search_pipeline
-from core.milvus_utilis import save_to_chromadb, search_similar_chunks, delete_file, delete_all, collection
-from core.embedding import split_into_chunks
+from core.milvus_utilis import save_to_chromadb, search_similar_chunks, delete_file, delete_all, list_filenames
+from core.embedding import iter_chunks
+
+# Precompiled pattern for whitespace cleanup (compiling per call is pure
+# overhead on multi-KB answers)
+_BLANKLINES_RE = re.compile(r'\n\s*\n')
+
+# Shared command reference, printed as one write instead of a print per line
+_HELP_TEXT = """Commands:
+  ask <question>     - Ask a question about your documents
+  askmany <q1 ;; q2> - Ask several questions concurrently (separate with ';;')
+  upload <file>      - Upload and process a document
+  upload-dir <path>  - Upload every .txt/.md file in a directory (parallel)
+  search <query>     - Search for similar content
+  delete <filename>  - Delete a document from the database
+  delete-all         - Delete ALL data from the database
+  list               - List all documents in the database
+  history            - Show conversation history
+  help               - Show this help message
+  quit               - Exit the application"""
+
+_HELP_TIP = "💡 Tip: Use quotes for file paths with spaces, e.g., upload \"testing files/document.pdf\""
+
+def _strip_think_blocks(text: str) -> str:
+    """
+    Remove <think>...</think> blocks (any case) with a single linear scan.
+    Unlike a backtracking regex, this stays O(n) even on adversarial inputs
+    such as unclosed or deeply nested tags; an unclosed tag is left in place.
+    """
+    lowered = text.lower()
+    if '<think>' not in lowered:
+        return text
+
+    parts = []
+    pos = 0
+    while True:
+        start = lowered.find('<think>', pos)
+        if start == -1:
+            parts.append(text[pos:])
+            break
+        parts.append(text[pos:start])
+        end = lowered.find('</think>', start + len('<think>'))
+        if end == -1:
+            # No closing tag: keep the remainder as-is
+            parts.append(text[start:])
+            break
+        pos = end + len('</think>')
+    return ''.join(parts)
 
 class ConversationMemory:
     """Manages conversation history for the CLI app"""
@@ -26,18 +80,13 @@ class ConversationMemory:
     def __init__(self, session_id: Optional[str] = None):
         self.session_id = session_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         self.history: List[Dict] = []
-        self.history_file = Path(f"conversation_history_{self.session_id}.json")
+        self.history_file = Path(f"conversation_history_{self.session_id}.jsonl")
+        self._ctx_cache: tuple = (-1, "")  # (history length, cached summary)
         
     def _clean_answer(self, answer: str) -> str:
         """Remove thinking tags and clean up the answer"""
-        # Remove <think>...</think> tags and their content
-        answer = re.sub(r'<think>.*?</think>', '', answer, flags=re.DOTALL)
-        # Remove any remaining thinking-related text
-        answer = re.sub(r'<THINK>.*?</THINK>', '', answer, flags=re.DOTALL)
-        # Clean up extra whitespace
-        answer = re.sub(r'\n\s*\n', '\n\n', answer)
-        answer = answer.strip()
-        return answer
+        # Remove <think>...</think> tags and their content, then collapse extra whitespace
+        return _BLANKLINES_RE.sub('\n\n', _strip_think_blocks(answer)).strip()
         
     def add_ask_query(self, question: str, answer: str):
         """Add an ask query with its answer"""
@@ -48,32 +97,33 @@ class ConversationMemory:
             "answer": cleaned_answer
         }
         self.history.append(entry)
-        self._save_history()
+        self._append_history(entry)
         
     def show_history(self):
         """Display conversation history"""
         if not self.history:
             print("📝 No conversation history yet.")
             return
-            
-        print(f"\n📝 Conversation History:")
-        print("=" * 50)
-        
+
+        # Assemble the whole listing and emit it in one write, instead of a
+        # few syscalls per entry (visible over SSH with long histories)
+        lines = ["\n📝 Conversation History:", "=" * 50]
         for i, entry in enumerate(self.history, 1):
-            question = entry["question"]
-            answer = entry["answer"]
-            
-            print(f"\n{i}. Q: {question}")
-            answer_preview = answer[:150] + "..." if len(answer) > 150 else answer
-            print(f"   A: {answer_preview}")
-        
-        print("=" * 50)
+            lines.append(f"\n{i}. Q: {entry['question']}")
+            lines.append(f"   A: {textwrap.shorten(entry['answer'], width=150, placeholder='...')}")
+        lines.append("=" * 50)
+        sys.stdout.write("\n".join(lines) + "\n")
         
-    def _save_history(self):
-        """Save history to file"""
+    def _append_history(self, entry: Dict):
+        """Append a single entry to the history file (line-delimited JSON)"""
+        # Appending only the newest entry keeps per-turn write cost constant
+        # instead of rewriting the whole growing history every turn
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.history, f, indent=2, ensure_ascii=False)
+            with open(self.history_file, 'ab') as f:
+                if orjson is not None:
+                    f.write(orjson.dumps(entry) + b'\n')
+                else:
+                    f.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
         except Exception as e:
             print(f"⚠️ Warning: Could not save conversation history: {e}")
             
@@ -91,15 +141,18 @@ class ConversationMemory:
         """Get a summary of recent conversation for context"""
         if not self.history:
             return ""
-            
-        recent_queries = self.history[-3:]  # Last 3 Q&A pairs
-        summary_parts = []
-        
-        for i, entry in enumerate(recent_queries, 1):
-            summary_parts.append(f"Q{i}: {entry['question']}")
-            summary_parts.append(f"A{i}: {entry['answer']}")
-                
-        return "\n".join(summary_parts)
+
+        # The summary only changes when history grows, so rebuild it at most
+        # once per turn instead of re-joining multi-KB answers on every call
+        if len(self.history) == self._ctx_cache[0]:
+            return self._ctx_cache[1]
+
+        summary = "\n".join(
+            f"Q{i}: {entry['question']}\nA{i}: {entry['answer']}"
+            for i, entry in enumerate(self.history[-3:], 1)  # Last 3 Q&A pairs
+        )
+        self._ctx_cache = (len(self.history), summary)
+        return summary
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """PDF support removed - this function is deprecated."""
@@ -108,9 +161,10 @@ def extract_text_from_pdf(pdf_path: str) -> str:
 
 def extract_text_from_txt(txt_path: str) -> str:
     """Extract text from a text file."""
+    # Read raw bytes in one preallocated buffer and decode once, instead of
+    # going through the TextIOWrapper stack's chunked decode on large files
     try:
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return Path(txt_path).read_bytes().decode('utf-8', errors='replace')
     except Exception as e:
         print(f"❌ Error reading text file {txt_path}: {e}")
         return ""
@@ -139,35 +193,70 @@ def process_document(file_path: str) -> bool:
         print(f"❌ No text extracted from {file_path}")
         return False
     
-    # Split into chunks
-    chunks = split_into_chunks(text)
-    print(f"📄 Extracted {len(chunks)} chunks from {file_path.name}")
-    
+    # Split lazily and stream chunks straight into the ingest pipeline, so only
+    # a micro-batch of chunks is materialized at a time
+    print(f"📄 Processing {file_path.name}...")
+
     # Save to ChromaDB
     try:
-        save_to_chromadb(chunks, file_path.name)
+        save_to_chromadb(iter_chunks(text), file_path.name)
         print(f"✅ Successfully processed {file_path.name}")
         return True
     except Exception as e:
         print(f"❌ Error saving to database: {e}")
         return False
 
+def process_directory(dir_path: str) -> bool:
+    """Process every .txt/.md file under a directory, uploading files in parallel."""
+    directory = Path(dir_path)
+
+    if not directory.is_dir():
+        print(f"❌ Directory not found: {directory}")
+        return False
+
+    files = sorted(set(directory.rglob('*.txt')) | set(directory.rglob('*.md')))
+    if not files:
+        print(f"📭 No .txt or .md files found in {directory}")
+        return False
+
+    # Documents are independent, so they can be embedded and saved in parallel;
+    # the embedding backend releases the GIL during encode, so threads suffice
+    max_workers = min(8, os.cpu_count() or 1)
+    print(f"📤 Uploading {len(files)} files with up to {max_workers} workers...")
+
+    succeeded = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(process_document, str(f)): f for f in files}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                if future.result():
+                    succeeded += 1
+            except Exception as e:
+                print(f"❌ Error processing {file_path}: {e}")
+
+    print(f"✅ Processed {succeeded}/{len(files)} files from {directory}")
+    return succeeded == len(files)
+
+async def deep_search_pipeline_async(question: str, chat_history: str = "") -> str:
+    """Async wrapper around deep_search_pipeline so multiple questions can run concurrently."""
+    return await asyncio.to_thread(deep_search_pipeline, question, chat_history=chat_history)
+
+def answer_questions_batch(questions: List[str], chat_history: str = "") -> List[str]:
+    """Answer several independent questions concurrently with asyncio.gather."""
+    async def _fanout():
+        return await asyncio.gather(
+            *[deep_search_pipeline_async(q, chat_history=chat_history) for q in questions]
+        )
+    return asyncio.run(_fanout())
+
 def interactive_mode():
     """Run the assistant in interactive mode."""
     print("🤖 AI Document Assistant - Interactive Mode")
     print("=" * 50)
-    print("Commands:")
-    print("  ask <question>     - Ask a question about your documents")
-    print("  upload <file>      - Upload and process a document")
-    print("  search <query>     - Search for similar content")
-    print("  delete <filename>  - Delete a document from the database")
-    print("  delete-all         - Delete ALL data from the database")
-    print("  list               - List all documents in the database")
-    print("  history            - Show conversation history")
-    print("  help               - Show this help message")
-    print("  quit               - Exit the application")
+    print(_HELP_TEXT)
     print("=" * 50)
-    print("💡 Tip: Use quotes for file paths with spaces, e.g., upload \"testing files/document.pdf\"")
+    print(_HELP_TIP)
     print("=" * 50)
     
     conversation_memory = ConversationMemory()
@@ -185,17 +274,8 @@ def interactive_mode():
                 break
                 
             elif user_input.lower() == 'help':
-                print("Commands:")
-                print("  ask <question>     - Ask a question about your documents")
-                print("  upload <file>      - Upload and process a document")
-                print("  search <query>     - Search for similar content")
-                print("  delete <filename>  - Delete a document from the database")
-                print("  delete-all         - Delete ALL data from the database")
-                print("  list               - List all documents in the database")
-                print("  history            - Show conversation history")
-                print("  help               - Show this help message")
-                print("  quit               - Exit the application")
-                print("\n💡 Tip: Use quotes for file paths with spaces, e.g., upload \"testing files/document.pdf\"")
+                print(_HELP_TEXT)
+                print("\n" + _HELP_TIP)
                 
             elif user_input.lower() == 'history':
                 conversation_memory.show_history()
@@ -216,11 +296,33 @@ def interactive_mode():
                         print(f"❌ Error: {e}")
                 else:
                     print("❌ Please provide a question after 'ask'")
-                    
+
+            elif user_input.lower().startswith('askmany '):
+                questions = [q.strip() for q in user_input[8:].split(';;') if q.strip()]
+                if questions:
+                    print(f"\n🤔 Answering {len(questions)} questions concurrently...")
+                    print("🔄 Thinking...")
+                    try:
+                        # Get conversation context once; the questions fan out in parallel
+                        context = conversation_memory.get_context_summary()
+                        answers = answer_questions_batch(questions, chat_history=context)
+                        for question, answer in zip(questions, answers):
+                            conversation_memory.add_ask_query(question, answer)
+                            print(f"\n🤔 Question: {question}")
+                            print(f"💡 Answer: {answer}")
+                    except Exception as e:
+                        print(f"❌ Error: {e}")
+                else:
+                    print("❌ Please provide questions after 'askmany', separated by ';;'")
+
             elif user_input.lower().startswith('upload '):
-                # Parse the upload command properly to handle spaces and quotes
+                # Parse the upload command properly to handle spaces and quotes;
+                # only pay the shlex tokenizer cost when quoting is actually present
                 try:
-                    parts = shlex.split(user_input)
+                    if '"' in user_input or "'" in user_input:
+                        parts = shlex.split(user_input)
+                    else:
+                        parts = user_input.split(maxsplit=1)
                     if len(parts) >= 2:
                         file_path = parts[1]
                         print(f"📤 Uploading {file_path}...")
@@ -230,7 +332,20 @@ def interactive_mode():
                 except Exception as e:
                     print(f"❌ Error parsing file path: {e}")
                     print("💡 Tip: Use quotes for file paths with spaces, e.g., upload \"testing files/document.pdf\"")
-                    
+
+            elif user_input.lower().startswith('upload-dir '):
+                try:
+                    if '"' in user_input or "'" in user_input:
+                        parts = shlex.split(user_input)
+                    else:
+                        parts = user_input.split(maxsplit=1)
+                    if len(parts) >= 2:
+                        process_directory(parts[1])
+                    else:
+                        print("❌ Please provide a directory path after 'upload-dir'")
+                except Exception as e:
+                    print(f"❌ Error parsing directory path: {e}")
+
             elif user_input.lower().startswith('search '):
                 query = user_input[7:].strip()
                 if query:
@@ -272,13 +387,7 @@ def interactive_mode():
                     
             elif user_input.lower() == 'list':
                 try:
-                    collection.load()
-                    results = collection.query(
-                        expr="",
-                        output_fields=["filename"],
-                        limit=1000
-                    )
-                    filenames = list(set([r["filename"] for r in results]))
+                    filenames = list_filenames()
                     if filenames:
                         print(f"\n📚 Documents in database ({len(filenames)}):")
                         for filename in filenames:
@@ -315,6 +424,7 @@ def main():
     parser = argparse.ArgumentParser(description="AI Document Assistant CLI")
     parser.add_argument("--ask", "-a", help="Ask a question directly")
     parser.add_argument("--upload", "-u", help="Upload and process a document")
+    parser.add_argument("--upload-dir", help="Upload every .txt/.md file in a directory")
     parser.add_argument("--search", "-s", help="Search for similar content")
     parser.add_argument("--delete", "-d", help="Delete a document from the database")
     parser.add_argument("--delete-all", action="store_true", help="Delete ALL data from the database")
@@ -323,7 +433,7 @@ def main():
     
     args = parser.parse_args()
     
-    if args.interactive or not any([args.ask, args.upload, args.search, args.delete, args.delete_all, args.list]):
+    if args.interactive or not any([args.ask, args.upload, args.upload_dir, args.search, args.delete, args.delete_all, args.list]):
         interactive_mode()
     else:
         # Single command mode
@@ -339,6 +449,9 @@ def main():
         elif args.upload:
             print(f"📤 Uploading {args.upload}...")
             process_document(args.upload)
+
+        elif args.upload_dir:
+            process_directory(args.upload_dir)
             
         elif args.search:
             print(f"🔍 Searching for: {args.search}")
@@ -373,13 +486,7 @@ def main():
                 
         elif args.list:
             try:
-                collection.load()
-                results = collection.query(
-                    expr="",
-                    output_fields=["filename"],
-                    limit=1000
-                )
-                filenames = list(set([r["filename"] for r in results]))
+                filenames = list_filenames()
                 if filenames:
                     print(f"\n📚 Documents in database ({len(filenames)}):")
                     for filename in filenames:
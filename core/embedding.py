@@ -1,7 +1,13 @@
 from sentence_transformers import SentenceTransformer
-from typing import List
+from typing import Callable, Iterator, List, Optional
 import time
 
+try:
+    import tiktoken
+    _token_enc = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _token_enc = None
+
 print("🕒 Starting model loading...")
 start_time = time.time()
 
@@ -16,15 +22,99 @@ CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 BATCH_SIZE = 32  # Process 32 chunks at a time
 
-def split_into_chunks(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
-    # Split text into overlapping chunks
-    chunks = []
+def iter_chunks(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    # Split text into overlapping chunks lazily, so downstream stages can
+    # start consuming before the whole document is materialized as a list
     start = 0
     while start < len(text):
         end = min(start + size, len(text))
-        chunk = text[start:end]
-        chunks.append(chunk.strip())
+        yield text[start:end].strip()
         start += size - overlap
+
+def split_into_chunks(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    # Split text into overlapping chunks
+    return list(iter_chunks(text, size, overlap))
+
+def token_length(text: str) -> int:
+    """
+    Length of text in embedding-model tokens. Uses tiktoken when installed;
+    otherwise the usual ~4-characters-per-token heuristic. Chunking by tokens
+    instead of characters keeps chunks inside the embedder's context window,
+    so nothing is silently truncated at embed time.
+    """
+    if _token_enc is not None:
+        return len(_token_enc.encode(text))
+    return max(1, len(text) // 4)
+
+# Separators tried in order when recursively splitting: paragraph, line,
+# sentence, word, and finally single characters as a last resort
+RECURSIVE_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+def split_text_recursive(text: str, chunk_size: int = 256, chunk_overlap: int = 38,
+                         length_function: Callable[[str], int] = token_length,
+                         separators: Optional[List[str]] = None) -> List[str]:
+    """
+    Split text into chunks of at most chunk_size (as measured by
+    length_function, token count by default), preferring to break at
+    paragraph, line and sentence boundaries before falling back to words and
+    characters. Consecutive chunks share roughly chunk_overlap of trailing
+    context. Unlike the fixed-width iter_chunks, boundaries land on natural
+    units, so chunks don't start or end mid-sentence.
+    """
+    if separators is None:
+        separators = RECURSIVE_SEPARATORS
+
+    # Pick the coarsest separator that actually occurs in this text
+    separator = separators[-1]
+    next_separators: List[str] = []
+    for i, candidate in enumerate(separators):
+        if candidate == "" or candidate in text:
+            separator = candidate
+            next_separators = separators[i + 1:]
+            break
+
+    if separator:
+        parts = text.split(separator)
+        # Re-attach the separator so joining pieces reproduces the original text
+        pieces = [part + separator for part in parts[:-1]] + [parts[-1]]
+    else:
+        pieces = list(text)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for piece in pieces:
+        piece_len = length_function(piece)
+        if piece_len > chunk_size and separator != "":
+            # Piece alone exceeds the budget: flush, then split it with the
+            # next finer separator
+            joined = "".join(current).strip()
+            if joined:
+                chunks.append(joined)
+            current, current_len = [], 0
+            chunks.extend(split_text_recursive(
+                piece, chunk_size, chunk_overlap, length_function, next_separators or [""]
+            ))
+            continue
+        if current and current_len + piece_len > chunk_size:
+            joined = "".join(current).strip()
+            if joined:
+                chunks.append(joined)
+            # Carry trailing pieces into the next chunk as overlap
+            kept: List[str] = []
+            kept_len = 0
+            for prev in reversed(current):
+                prev_len = length_function(prev)
+                if kept_len + prev_len > chunk_overlap:
+                    break
+                kept.insert(0, prev)
+                kept_len += prev_len
+            current, current_len = kept, kept_len
+        current.append(piece)
+        current_len += piece_len
+    joined = "".join(current).strip()
+    if joined:
+        chunks.append(joined)
     return chunks
 
 def embed_chunks(chunks: List[str]) -> List[List[float]]:
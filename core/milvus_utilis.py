@@ -1,94 +1,328 @@
 import chromadb
+import json
+import numpy as np
 from chromadb.config import Settings
 from core.embedding import embed_chunks, split_into_chunks
-import uuid
+import queue
+import threading
 import time
 import os
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
 
-print("🕒 Initializing ChromaDB...")
-start_time = time.time()
+# HNSW index settings for new collections: cosine similarity, with explicit
+# graph parameters (M = graph degree, construction_ef/search_ef = beam widths)
+# tuned for better recall/QPS than ChromaDB's defaults as the collection grows
+_COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 128,
+    "hnsw:search_ef": 64,
+}
 
-# Initialize ChromaDB client with persistent storage
-chroma_client = chromadb.PersistentClient(
-    path="./chroma_db",
-    settings=Settings(
-        anonymized_telemetry=False,
-        allow_reset=True
-    )
-)
-
-# Get or create collection
-try:
-    collection = chroma_client.get_collection("documents")
-    print("✅ Connected to existing ChromaDB collection")
-except:
-    collection = chroma_client.create_collection(
-        name="documents",
-        metadata={"hnsw:space": "cosine"}  # Use cosine similarity
+# Client and collection are initialized lazily on first real use, so importing
+# this module (e.g. for `cli_app.py --help` or in tests) doesn't pay the DB
+# open cost. Directory ingest touches the DB from several threads at once, so
+# the lazy init uses double-checked locking: the unlocked fast path keeps
+# steady-state reads cheap, the lock keeps a cold start from constructing two
+# clients or racing get/create on the collection
+_client = None
+_collection = None
+_init_lock = threading.Lock()
+
+def _get_client():
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                print("🕒 Initializing ChromaDB...")
+                start_time = time.time()
+                # Initialize ChromaDB client with persistent storage
+                _client = chromadb.PersistentClient(
+                    path="./chroma_db",
+                    settings=Settings(
+                        anonymized_telemetry=False,
+                        allow_reset=True
+                    )
+                )
+                print(f"✅ ChromaDB initialized in {time.time() - start_time:.2f} seconds")
+    return _client
+
+def _get_collection():
+    global _collection
+    if _collection is None:
+        client = _get_client()
+        with _init_lock:
+            if _collection is None:
+                # Get or create collection
+                try:
+                    _collection = client.get_collection("documents")
+                    print("✅ Connected to existing ChromaDB collection")
+                except:
+                    _collection = client.create_collection(
+                        name="documents",
+                        metadata=_COLLECTION_METADATA
+                    )
+                    print("✅ Created new ChromaDB collection")
+    return _collection
+
+def __getattr__(name):
+    # PEP 562: keep `from core.milvus_utilis import collection` working for
+    # callers while still deferring the DB open until the name is touched
+    if name == "collection":
+        return _get_collection()
+    if name == "chroma_client":
+        return _get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Ingest batching: chunks are embedded in small micro-batches so DB writes can
+# start before the whole document is embedded, and writes are aggregated back
+# into large batches to stay within ChromaDB limits
+EMBED_BATCH_SIZE = 256
+WRITE_BATCH_SIZE = 10000  # Safe batch size for ChromaDB
+_QUEUE_MAX_BATCHES = 4    # Bounds embedded-but-unwritten chunks (backpressure)
+
+def _write_batch(batch_ids, batch_vectors, batch_chunks, batch_metadatas) -> int:
+    """Upsert one prepared batch into ChromaDB and return its size."""
+    # upsert rather than add: add() skips existing IDs, so re-uploading a
+    # modified file would silently keep the stale chunk text under the
+    # deterministic filename:index IDs
+    _get_collection().upsert(
+        ids=batch_ids,
+        embeddings=batch_vectors,
+        documents=batch_chunks,
+        metadatas=batch_metadatas
     )
-    print("✅ Created new ChromaDB collection")
+    print(f"📦 Saved batch of {len(batch_ids)} chunks")
+    return len(batch_ids)
+
+def _ingest_pipelined(chunks: Iterable[str], filename: str) -> int:
+    """
+    Embed micro-batches on a producer thread while the consumer aggregates them
+    into write batches and inserts into ChromaDB, so embedding and DB I/O
+    overlap instead of running back-to-back. Accepts any iterable (including a
+    lazy chunk generator), and the bounded queue keeps at most a few
+    micro-batches in flight, so only a sliver of the document is in memory.
+    """
+    batch_queue: queue.Queue = queue.Queue(maxsize=_QUEUE_MAX_BATCHES)
+    # Set when the consumer dies so the producer can't stay blocked forever
+    # on a put into the full bounded queue (which would hang the executor's
+    # shutdown and swallow the write error)
+    consumer_failed = threading.Event()
+
+    def _queue_put(item) -> bool:
+        """Bounded put that gives up once the consumer has stopped."""
+        while not consumer_failed.is_set():
+            try:
+                batch_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _embed_producer():
+        try:
+            chunk_iter = iter(chunks)
+            index = 0
+            while True:
+                micro = list(islice(chunk_iter, EMBED_BATCH_SIZE))
+                if not micro:
+                    break
+                end_idx = index + len(micro)
+                # Deterministic composite IDs (filename + chunk index) instead
+                # of uuid4: no per-chunk RNG draw, and re-ingesting the same
+                # file upserts in place rather than creating duplicate rows
+                ids = [f"{filename}:{j}" for j in range(index, end_idx)]
+                metas = [{"filename": filename, "chunk_index": j} for j in range(index, end_idx)]
+                if not _queue_put((ids, embed_chunks(micro), micro, metas)):
+                    return
+                index = end_idx
+        finally:
+            _queue_put(None)  # Sentinel: no more batches
+
+    total_saved = 0
+    ids: List[str] = []
+    vectors: List[List[float]] = []
+    docs: List[str] = []
+    metas: List[Dict] = []
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        producer = executor.submit(_embed_producer)
+        try:
+            while True:
+                item = batch_queue.get()
+                if item is None:
+                    break
+                batch_ids, batch_vectors, batch_docs, batch_metas = item
+                ids.extend(batch_ids)
+                vectors.extend(batch_vectors)
+                docs.extend(batch_docs)
+                metas.extend(batch_metas)
+                if len(ids) >= WRITE_BATCH_SIZE:
+                    total_saved += _write_batch(ids, vectors, docs, metas)
+                    ids, vectors, docs, metas = [], [], [], []
+        except BaseException:
+            # Unblock the producer before the executor's shutdown waits on
+            # it, then let the write error propagate
+            consumer_failed.set()
+            raise
+        producer.result()  # Propagate embedding errors, if any
 
-connect_time = time.time() - start_time
-print(f"✅ ChromaDB initialized in {connect_time:.2f} seconds")
+    if ids:
+        total_saved += _write_batch(ids, vectors, docs, metas)
+    return total_saved
 
-def save_to_chromadb(chunks: List[str], filename: str, vectors: Optional[List[List[float]]] = None):
+def save_to_chromadb(chunks: Iterable[str], filename: str, vectors: Optional[List[List[float]]] = None):
     """
     Save text chunks and their vectors to ChromaDB. Each chunk gets a unique ID.
-    Handles large documents by processing in batches.
+    Handles large documents by processing in batches; when embeddings are not
+    provided, chunks may be any iterable (lazy generators included) and are
+    streamed through overlapping embed/write pipeline stages.
     """
     start_time = time.time()
-    
-    # Generate embeddings if not provided
+
     if vectors is None:
-        print(f"⏱️ Embedding {len(chunks)} chunks...")
-        vectors = embed_chunks(chunks)
-        print(f"⏱️ Embedding completed in {time.time() - start_time:.2f} seconds")
-    
-    # Process in batches to avoid ChromaDB limits
-    batch_size = 10000  # Safe batch size for ChromaDB
-    total_saved = 0
-    
-    for i in range(0, len(chunks), batch_size):
-        end_idx = min(i + batch_size, len(chunks))
-        batch_chunks = chunks[i:end_idx]
-        batch_vectors = vectors[i:end_idx]
-        
-        # Generate unique IDs for this batch
-        batch_ids = [str(uuid.uuid4()) for _ in batch_chunks]
-        
-        # Prepare metadata for this batch
-        batch_metadatas = [{"filename": filename, "chunk_index": j} for j in range(i, end_idx)]
-
-        # Insert batch into ChromaDB
-        collection.add(
-            ids=batch_ids,
-            embeddings=batch_vectors,
-            documents=batch_chunks,
-            metadatas=batch_metadatas
-        )
-        
-        total_saved += len(batch_chunks)
-        print(f"📦 Saved batch {i//batch_size + 1}/{(len(chunks) + batch_size - 1)//batch_size} ({len(batch_chunks)} chunks)")
-    
+        print("⏱️ Embedding and saving chunks...")
+        total_saved = _ingest_pipelined(chunks, filename)
+    else:
+        # Pre-embedded chunks: plain batched writes
+        chunks = list(chunks)
+        total_saved = 0
+        for i in range(0, len(chunks), WRITE_BATCH_SIZE):
+            end_idx = min(i + WRITE_BATCH_SIZE, len(chunks))
+            batch_ids = [f"{filename}:{j}" for j in range(i, end_idx)]
+            batch_metadatas = [{"filename": filename, "chunk_index": j} for j in range(i, end_idx)]
+            total_saved += _write_batch(batch_ids, vectors[i:end_idx], chunks[i:end_idx], batch_metadatas)
+
+    register_filename(filename)
+    _invalidate_filename_cache()
     save_time = time.time() - start_time
     print(f"✅ Successfully saved {total_saved} chunks to ChromaDB in {save_time:.2f} seconds")
 
-def search_similar_chunks(query: str, top_k: int = 1000) -> List[Dict]:
+# Load-state tracking: loading the collection into memory only needs to happen
+# once per process, not on every read command
+_loaded = False
+
+def ensure_loaded():
+    """Load the collection on first use; later calls are no-ops."""
+    global _loaded
+    if not _loaded:
+        try:
+            _get_collection().load()
+        except AttributeError:
+            pass  # ChromaDB collections have no explicit load step
+        _loaded = True
+
+# Tiny sidecar index of uploaded filenames, kept next to the DB files and
+# updated on every save/delete. Listing documents then costs one small JSON
+# read instead of asking ChromaDB to materialize every row's metadata
+_FILENAMES_INDEX_PATH = "./chroma_db/_filenames.json"
+# save_to_chromadb runs from several threads during directory ingest, so the
+# index's read-modify-write must be atomic or concurrent registers can lose
+# filenames (both read the same snapshot, last writer wins)
+_filename_index_lock = threading.Lock()
+
+def _read_filename_index() -> Optional[List[str]]:
+    try:
+        with open(_FILENAMES_INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_filename_index(filenames: List[str]):
+    try:
+        os.makedirs(os.path.dirname(_FILENAMES_INDEX_PATH), exist_ok=True)
+        with open(_FILENAMES_INDEX_PATH, "w", encoding="utf-8") as f:
+            json.dump(sorted(filenames), f)
+    except OSError as e:
+        print(f"⚠️ Could not update filename index: {e}")
+
+def register_filename(filename: str):
+    """Record a filename in the sidecar index after a successful save."""
+    with _filename_index_lock:
+        names = set(_read_filename_index() or [])
+        if filename not in names:
+            names.add(filename)
+            _write_filename_index(list(names))
+
+def unregister_filename(filename: str):
+    """Drop a filename from the sidecar index after its chunks are deleted."""
+    with _filename_index_lock:
+        names = set(_read_filename_index() or [])
+        if filename in names:
+            names.discard(filename)
+            _write_filename_index(list(names))
+
+# Distinct-filename cache: invalidated whenever the collection's contents
+# change, so repeat `list` calls don't re-query the backend
+_filename_cache: Optional[List[str]] = None
+
+# Callbacks fired on every save/delete, so caches living in other modules
+# (e.g. rag_chain's semantic retrieval cache) can drop entries that now
+# reflect a stale corpus; registration avoids a circular import
+_mutation_callbacks: List = []
+
+def register_mutation_callback(callback):
+    """Call `callback()` whenever the collection's contents change."""
+    _mutation_callbacks.append(callback)
+
+def _notify_mutation():
+    for callback in _mutation_callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print(f"⚠️ Mutation callback failed: {e}")
+
+def _invalidate_filename_cache():
+    global _filename_cache
+    _filename_cache = None
+    _notify_mutation()
+
+def list_filenames() -> List[str]:
     """
-    Embed the query and find the top_k most similar text chunks in ChromaDB.
+    Return the distinct filenames stored in the collection, sorted for stable
+    output. The sidecar index answers this without touching ChromaDB at all;
+    scanning the collection's metadata is only a fallback for databases created
+    before the index existed (and the scan result is written back so the slow
+    path runs at most once). The result is cached until the next save/delete.
+    """
+    global _filename_cache
+    if _filename_cache is None:
+        indexed = _read_filename_index()
+        if indexed is not None:
+            _filename_cache = sorted(indexed)
+        else:
+            ensure_loaded()
+            results = _get_collection().get(include=["metadatas"])
+            _filename_cache = sorted({(md or {}).get("filename", "unknown") for md in results["metadatas"]})
+            _write_filename_index(_filename_cache)
+    return _filename_cache
+
+@lru_cache(maxsize=256)
+def _embed_query(query: str) -> Tuple[float, ...]:
+    """
+    Embed a single query string, caching the result so repeat queries (e.g.
+    `search foo` followed by `ask foo`) skip the model forward pass. Returns a
+    tuple because lru_cache needs hashable values.
     """
-    start_time = time.time()
-    
-    # Get query embedding
     query_vectors = embed_chunks([query])
     if not query_vectors:
         raise ValueError("Failed to generate embedding for query")
-    
-    query_vector = query_vectors[0]  # Use the first (and only) vector
+    return tuple(query_vectors[0])
+
+def search_similar_chunks(query: str, top_k: int = 1000) -> List[Dict]:
+    """
+    Embed the query and find the top_k most similar text chunks in ChromaDB.
+    """
+    start_time = time.time()
+
+    # Get query embedding (cached for repeat queries)
+    query_vector = list(_embed_query(query))
 
     # Search in ChromaDB
-    results = collection.query(
+    results = _get_collection().query(
         query_embeddings=[query_vector],
         n_results=top_k,
         include=["documents", "metadatas", "distances"]
@@ -96,19 +330,20 @@ def search_similar_chunks(query: str, top_k: int = 1000) -> List[Dict]:
 
     matches = []
     if results['documents'] and results['documents'][0]:
-        for i, (doc, metadata, distance) in enumerate(zip(
-            results['documents'][0], 
-            results['metadatas'][0], 
-            results['distances'][0]
-        )):
-            # Convert distance to similarity score (ChromaDB uses cosine distance)
-            # Cosine distance ranges from 0 to 2, where 0 is most similar
-            similarity_score = 1 - (distance / 2)  # Convert to 0-1 range where 1 is most similar
-            matches.append({
-                "score": similarity_score,
+        docs = results['documents'][0]
+        metas = results['metadatas'][0]
+        # Convert cosine distance (0-2, 0 is most similar) to a 0-1 similarity
+        # score in one vectorized pass instead of top_k Python-level divisions
+        dists = np.asarray(results['distances'][0], dtype=np.float32)
+        scores = (1.0 - dists * 0.5).tolist()
+        matches = [
+            {
+                "score": score,
                 "chunk": doc,
-                "filename": metadata.get("filename", "unknown")
-            })
+                "filename": (metadata or {}).get("filename", "unknown")
+            }
+            for doc, metadata, score in zip(docs, metas, scores)
+        ]
 
     search_time = time.time() - start_time
     print(f"⏱️ Search completed in {search_time:.2f} seconds")
@@ -119,19 +354,21 @@ def delete_file(filename: str) -> Dict:
     Delete all chunks of a file from ChromaDB by filename.
     """
     try:
-        # Get all documents with the specified filename
-        results = collection.get(
-            where={"filename": filename},
-            include=["ids"]
-        )
-        
-        if results['ids']:
-            # Delete by IDs
-            collection.delete(ids=results['ids'])
-            print(f"✅ Deleted {len(results['ids'])} chunks of {filename} from ChromaDB.")
+        # Delete server-side with a where predicate instead of materializing
+        # every matching ID in the client first; the affected count comes from
+        # the collection size before/after
+        collection = _get_collection()
+        count_before = collection.count()
+        collection.delete(where={"filename": filename})
+        deleted = count_before - collection.count()
+        unregister_filename(filename)
+        _invalidate_filename_cache()
+
+        if deleted:
+            print(f"✅ Deleted {deleted} chunks of {filename} from ChromaDB.")
             return {
                 "filename": filename,
-                "message": f"✅ Deleted {len(results['ids'])} chunks of {filename} from ChromaDB."
+                "message": f"✅ Deleted {deleted} chunks of {filename} from ChromaDB."
             }
         else:
             print(f"📭 No chunks found for {filename}")
@@ -150,25 +387,33 @@ def delete_all() -> Dict:
     """
     Delete all data from the ChromaDB collection.
     """
+    global _collection
     try:
-        # Get all documents
-        results = collection.get(
-            include=["ids"]
-        )
-        
-        if not results['ids']:
+        count = _get_collection().count()
+        if not count:
             print("📭 No data to delete - collection is already empty.")
             return {
                 "message": "📭 No data to delete - collection is already empty."
             }
-        
-        # Delete all documents
-        collection.delete(ids=results['ids'])
-        
-        print(f"🗑️ Deleted {len(results['ids'])} records from ChromaDB collection.")
-        
+
+        # Dropping and recreating the collection is a constant-time metadata
+        # operation, versus enumerating every ID client-side just to delete
+        # it. Same lock as the lazy init so a concurrent _get_collection
+        # can't observe the dropped-but-not-recreated window
+        client = _get_client()
+        with _init_lock:
+            client.delete_collection("documents")
+            _collection = client.create_collection(
+                name="documents",
+                metadata=_COLLECTION_METADATA
+            )
+        _write_filename_index([])
+        _invalidate_filename_cache()
+
+        print(f"🗑️ Deleted {count} records from ChromaDB collection.")
+
         return {
-            "message": f"✅ Successfully deleted {len(results['ids'])} records from the database."
+            "message": f"✅ Successfully deleted {count} records from the database."
         }
     except Exception as e:
         print(f"❌ Error deleting all data: {e}")
@@ -181,7 +426,7 @@ def get_collection_info() -> Dict:
     Get information about the collection.
     """
     try:
-        count = collection.count()
+        count = _get_collection().count()
         return {
             "total_chunks": count,
             "collection_name": "documents"
@@ -3,34 +3,254 @@ Deep Search Model for Immigration QA
 """
 
 from config.config import LLM_API_URL, LLM_API_KEY
-from core.milvus_utilis import search_similar_chunks
+from core.milvus_utilis import search_similar_chunks, _embed_query, register_mutation_callback
+import asyncio
+import hashlib
+import httpx
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os
 import requests
 import json
 import re
+import sqlite3
+import threading
 import time
 
-# --- LLM API Call ---
-def ask_llm(prompt: str) -> str:
-    payload = {
-        "model": "gpt-4",
+try:
+    import orjson  # Much faster JSON encode/decode for LLM payloads
+except ImportError:
+    orjson = None
+
+try:
+    import tiktoken  # Exact token counts for history truncation
+except ImportError:
+    tiktoken = None
+
+def _json_dumps(obj) -> bytes:
+    """Serialize to JSON bytes, via orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode()
+
+def _json_loads(data):
+    """Parse JSON from str/bytes, via orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Cap on concurrent in-flight LLM requests during async fan-out, to stay
+# under provider rate limits
+LLM_CONCURRENCY = 8
+LLM_TIMEOUT = 60.0
+
+# One pooled session for all sync LLM calls: reusing the socket avoids a fresh
+# TCP + TLS handshake on each of the many calls a single user query makes
+_session = requests.Session()
+_adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+# Tiered model routing: classification, expansion and quality checks are
+# short JSON-emission tasks a small model handles fine at a fraction of the
+# latency; only the user-facing prose (outline, final answer, direct answer)
+# goes to the large model
+FAST_MODEL = "gpt-4o-mini"
+SMART_MODEL = "gpt-4"
+
+def _llm_payload(prompt: str, model: str = SMART_MODEL) -> dict:
+    return {
+        "model": model,
         "messages": [
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt}
         ]
     }
-    headers = {
+
+def _llm_headers() -> dict:
+    return {
         "Authorization": f"Bearer {LLM_API_KEY}",
         "Content-Type": "application/json"
     }
+
+# --- LLM Response Cache ---
+class LLMResponseCache:
+    """
+    Persistent exact-match cache for LLM responses, keyed on a SHA-256 of the
+    request payload (model + messages). Identical prompts recur across
+    sessions (classification, outlines for FAQ queries); a hit turns a
+    multi-second LLM call into a local read. A small in-memory layer sits in
+    front of the SQLite file.
+    """
+
+    def __init__(self, path: str = "./llm_cache.db"):
+        self.path = path
+        self._local = threading.local()  # SQLite connections are per-thread
+        self._mem: dict = {}
+        self._mem_max = 256
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT)")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key_for(payload: dict) -> str:
+        if orjson is not None:
+            return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str):
+        if key in self._mem:
+            return self._mem[key]
+        row = self._conn().execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._remember(key, row[0])
+            return row[0]
+        return None
+
+    def set(self, key: str, response: str):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)", (key, response))
+        conn.commit()
+        self._remember(key, response)
+
+    def _remember(self, key: str, response: str):
+        if len(self._mem) >= self._mem_max:
+            self._mem.clear()
+        self._mem[key] = response
+
+_llm_cache = LLMResponseCache()
+
+# --- LLM API Call ---
+def ask_llm(prompt: str, cache_bypass: bool = False, model: str = SMART_MODEL,
+            response_format: dict = None) -> str:
+    if not LLM_API_URL:
+        raise ValueError("LLM_API_URL is not configured in environment variables")
+    payload = _llm_payload(prompt, model=model)
+    if response_format is not None:
+        # OpenAI JSON mode: constrains the model to emit valid JSON, so
+        # callers don't have to fish the object out of surrounding prose
+        payload["response_format"] = response_format
+    key = LLMResponseCache.key_for(payload)
+    if not cache_bypass:
+        cached = _llm_cache.get(key)
+        if cached is not None:
+            return cached
+    response = _session.post(LLM_API_URL, data=_json_dumps(payload), headers=_llm_headers(), timeout=LLM_TIMEOUT)
+    response.raise_for_status()
+    content = _json_loads(response.content)["choices"][0]["message"]["content"]
+    if not cache_bypass:
+        _llm_cache.set(key, content)
+    return content
+
+def ask_llm_stream(prompt: str, model: str = SMART_MODEL):
+    """
+    Yield the LLM response incrementally as it is generated (SSE streaming),
+    so callers can render tokens at first-token latency instead of waiting
+    for the full completion.
+    """
     if not LLM_API_URL:
         raise ValueError("LLM_API_URL is not configured in environment variables")
-    response = requests.post(LLM_API_URL, json=payload, headers=headers)
+    payload = {**_llm_payload(prompt, model=model), "stream": True}
+    with _session.post(LLM_API_URL, data=_json_dumps(payload), headers=_llm_headers(),
+                       timeout=LLM_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                delta = _json_loads(data)["choices"][0].get("delta", {}).get("content")
+            except (KeyError, IndexError, ValueError):
+                continue
+            if delta:
+                yield delta
+
+async def ask_llm_async(prompt: str, client: "httpx.AsyncClient", semaphore: asyncio.Semaphore,
+                        cache_bypass: bool = False, model: str = SMART_MODEL) -> str:
+    """Async variant of ask_llm; the semaphore bounds concurrent requests."""
+    if not LLM_API_URL:
+        raise ValueError("LLM_API_URL is not configured in environment variables")
+    payload = _llm_payload(prompt, model=model)
+    key = LLMResponseCache.key_for(payload)
+    if not cache_bypass:
+        cached = await asyncio.to_thread(_llm_cache.get, key)
+        if cached is not None:
+            return cached
+    async with semaphore:
+        response = await client.post(LLM_API_URL, content=_json_dumps(payload), headers=_llm_headers())
     response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"]
+    content = _json_loads(response.content)["choices"][0]["message"]["content"]
+    if not cache_bypass:
+        await asyncio.to_thread(_llm_cache.set, key, content)
+    return content
 
 
 
 # --- Immigration Domain Detection ---
+# Local prefilter lexicon: unambiguous immigration vocabulary compiled into a
+# single alternation (one linear scan over the query, no backtracking) plus a
+# pattern for USCIS form numbers like I-485 or N-400. Built once at import
+_IMMIGRATION_KEYWORDS = (
+    "green card", "uscis", "nonimmigrant",
+    "removal proceedings", "adjustment of status",
+    "permanent resident", "work permit", "employment authorization",
+    "biometrics", "priority date", "visa bulletin", "consular processing",
+    "daca", "tps", "h-1b", "h1b", "f-1", "j-1", "k-1", "eb-1", "eb-2", "eb-3",
+    "eb-5", "b-2", "l-1", "o-1", "i-9", "cbp",
+    "petition", "waiver", "port of entry",
+)
+# Acronyms that are ordinary English words in lowercase ("ice cream", "opt
+# out", "perm treatment"); matched case-sensitively so only the uppercase
+# agency/program forms count as lexicon hits
+_IMMIGRATION_ACRONYM_RE = re.compile(r"\b(?:OPT|PERM|ICE)\b")
+# Stem patterns so common inflections count too: "become a citizen",
+# "eligible to naturalize", "get deported" are all squarely on-topic but
+# don't contain the noun forms an exact-word lexicon would list
+_IMMIGRATION_STEMS = (
+    r"citizen\w*", r"naturali[sz]\w*", r"deport\w*", r"immigra\w*",
+    r"asyl\w*", r"refugee\w*", r"visa\w*", r"sponsor\w*", r"overstay\w*",
+)
+_IMMIGRATION_KW_RE = re.compile(
+    r"\b(?:"
+    + "|".join([re.escape(kw) for kw in _IMMIGRATION_KEYWORDS] + list(_IMMIGRATION_STEMS))
+    + r")\b",
+    re.IGNORECASE,
+)
+_FORM_NUMBER_RE = re.compile(r"\b[IN]-\d{2,4}\b", re.IGNORECASE)
+# Terms that often show up in immigration questions without naming the domain;
+# their presence makes a zero-keyword query ambiguous rather than off-topic
+_AMBIGUOUS_TOKENS = frozenset({
+    "travel", "passport", "border", "status", "lawyer", "attorney", "form",
+    "application", "interview", "residence", "resident", "alien", "country",
+    "abroad", "embassy", "consulate", "marriage", "spouse", "work", "job",
+    "student", "family", "petition", "case",
+})
+
+def is_immigration_related_fast(query: str):
+    """
+    Cheap local classification of the obvious cases so they skip the LLM
+    round-trip entirely. Returns True (clearly on-topic: two or more lexicon
+    hits, or a USCIS form number), False (clearly off-topic: no hits and no
+    ambiguous vocabulary), or None when the query should go to the LLM.
+    """
+    hits = (len(_IMMIGRATION_KW_RE.findall(query))
+            + len(_IMMIGRATION_ACRONYM_RE.findall(query))
+            + len(_FORM_NUMBER_RE.findall(query)))
+    if hits >= 2 or _FORM_NUMBER_RE.search(query):
+        return True
+    if hits == 0 and not (_AMBIGUOUS_TOKENS & set(re.findall(r"[a-z]+", query.lower()))):
+        return False
+    return None
+
 def is_immigration_related(query: str, chat_history: str = "") -> bool:
     prompt = f"""
 CHAT HISTORY:
@@ -45,7 +265,7 @@ NOTE: the question itself can be unclear, ambiguous, read the whole chat history
 Respond with ONLY YES or NO.
 """
     try:
-        response = ask_llm(prompt)
+        response = ask_llm(prompt, model=FAST_MODEL)
         answer = response.strip().upper()
         add_debug(f"🔍 is_immigration_related: {answer}")
         return answer.endswith("YES")
@@ -94,7 +314,7 @@ Return ONLY the transformed query as a single line of text. If no transformation
 TRANSFORMED QUERY:
 """
     try:
-        response = ask_llm(prompt)
+        response = ask_llm(prompt, model=FAST_MODEL)
         transformed = response.strip().strip('"')
         add_debug(f"🔍 Query transformation: '{query}' → '{transformed}'")
         return transformed if transformed else query
@@ -157,39 +377,230 @@ Expanded queries:
 "Nvidia's new updates"]
 
 # RESPONSE FORMAT
-Your entire response MUST be valid parseable JSON, starting with '[' and ending with ']'.
-Do not include any text before or after the JSON array.
-
-Example of CORRECT response format:
-["query 1", "query 2", "query 3", "query 4", "query 5"]
+Your entire response MUST be a valid parseable JSON object of the form:
+{{"queries": ["query 1", "query 2", "query 3", "query 4", "query 5"]}}
+Do not include any text before or after the JSON object.
 
 """
     try:
-        response = ask_llm(prompt)
+        response = ask_llm(prompt, model=FAST_MODEL, response_format=_EXPANSION_RESPONSE_FORMAT)
         response = response.strip()
-        start = response.find('[')
-        end = response.rfind(']')
-        if start != -1 and end != -1 and end > start:
-            json_str = response[start:end+1]
-            subquestions = json.loads(json_str)
+        subquestions = _parse_query_list(response)
+        if subquestions is not None:
             add_debug(f"🔍 Subquestions: {subquestions}")
-            if isinstance(subquestions, list) and all(isinstance(q, str) for q in subquestions):
-                return subquestions
+            return subquestions
         add_debug("⚠️ LLM did not return a valid JSON list of strings. Returning original query as fallback.")
         return [query]
     except Exception as e:
         add_debug(f"⚠️ Error in query_expansion: {e}")
         return [query]
 
-# --- Semantic Search for Subquestions ---
-def ask_llm_with_context(query: str, chat_history: str = "") -> str:
-    results = search_similar_chunks(query, top_k=300)
-    if not results:
-        return "No relevant information found."
-    context = "\n".join([r["chunk"] for r in results])
+# JSON mode schema for query_expansion: the model is constrained to emit
+# exactly {"queries": [five strings]}, so parsing is a plain loads
+_EXPANSION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "expansions",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "queries": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "minItems": 5,
+                    "maxItems": 5,
+                }
+            },
+            "required": ["queries"],
+        },
+    },
+}
+
+def _parse_query_list(response: str):
+    """
+    Parse the expansion response: JSON mode yields {"queries": [...]}, but a
+    bare array or an object buried in prose (providers without JSON-mode
+    support) is still accepted. Returns None if no list of strings is found.
+    """
+    try:
+        parsed = _json_loads(response)
+    except ValueError:
+        start = response.find('[')
+        end = response.rfind(']')
+        if start == -1 or end <= start:
+            return None
+        try:
+            parsed = _json_loads(response[start:end + 1])
+        except ValueError:
+            return None
+    if isinstance(parsed, dict):
+        parsed = parsed.get("queries")
+    if isinstance(parsed, list) and all(isinstance(q, str) for q in parsed):
+        return parsed
+    return None
+
+# --- Combined Classification + Expansion ---
+def classify_and_expand(query: str, chat_history: str = "") -> tuple[bool, list]:
+    """
+    Classify whether the query is immigration-related and, if so, expand it
+    into 5 search queries — in a single LLM round-trip instead of the two
+    sequential calls (is_immigration_related then query_expansion) used before.
+    Obvious cases are settled by the local keyword prefilter without any
+    classification call at all.
+    """
+    add_debug("START CLASSIFY + EXPAND")
+    fast = is_immigration_related_fast(query)
+    if fast is False:
+        add_debug("🔍 Keyword prefilter: clearly not immigration-related, skipping LLM classification")
+        return False, []
+    if fast is True:
+        add_debug("🔍 Keyword prefilter: clearly immigration-related, expanding directly")
+        return True, query_expansion(query, chat_history=chat_history) or [query]
     prompt = f"""
 CHAT HISTORY:
 {chat_history}
+
+You are an expert classifier and query expansion expert for US immigration law.
+
+Original query: {query}
+
+STEP 1 - CLASSIFY:
+Determine if the user question is about US immigration or citizenship (including visas, green cards, naturalization, USCIS, etc). The question itself can be unclear or ambiguous; read the whole chat history to comprehend it.
+
+STEP 2 - EXPAND (only if the question is immigration-related):
+Generate 5 search queries that:
+1. EXPAND on the query with more specific details or broader context
+2. Explore DIFFERENT FACETS of the same general topic
+3. Include key entities from the query
+4. Add relevant modifiers, related concepts, or specific aspects
+5. Vary in scope (some narrower/focused, some broader/comprehensive)
+Each query should be clearly connected to the original topic and MEANINGFULLY DIFFERENT from the others — not simple rephrasings.
+
+# RESPONSE FORMAT
+Your entire response MUST be a valid, parseable JSON object and nothing else, starting with '{{' and ending with '}}':
+{{"is_immigration": true, "expansions": ["query 1", "query 2", "query 3", "query 4", "query 5"]}}
+
+If the question is NOT immigration-related, return exactly:
+{{"is_immigration": false, "expansions": []}}
+"""
+    try:
+        response = ask_llm(prompt, model=FAST_MODEL).strip()
+        start = response.find('{')
+        end = response.rfind('}')
+        if start != -1 and end != -1 and end > start:
+            result = json.loads(response[start:end+1])
+            is_immigration = bool(result.get("is_immigration", False))
+            expansions = result.get("expansions", [])
+            if isinstance(expansions, list) and all(isinstance(q, str) for q in expansions):
+                add_debug(f"🔍 classify_and_expand: is_immigration={is_immigration}, expansions={expansions}")
+                if is_immigration:
+                    return True, expansions or [query]
+                return False, []
+        add_debug("⚠️ classify_and_expand did not return valid JSON. Falling back to separate calls.")
+    except Exception as e:
+        add_debug(f"⚠️ Error in classify_and_expand: {e}. Falling back to separate calls.")
+    related = is_immigration_related(query, chat_history=chat_history)
+    return related, query_expansion(query, chat_history=chat_history) if related else []
+
+# --- Semantic Query Cache ---
+class SemanticCache:
+    """
+    Reuses retrieval results for semantically near-duplicate queries. Query
+    expansion and the refine loop produce many close variants of the same
+    question; when a new query's embedding is within `threshold` cosine
+    similarity of a cached one, the stored chunk list is returned without
+    touching the vector store. Oldest entries are evicted past `max_entries`,
+    entries older than `ttl` seconds are ignored, and the whole cache is
+    cleared whenever the corpus changes — a hit must never outlive the
+    documents it was retrieved from.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 128,
+                 ttl: float = 600.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._vectors = None  # (N, d) float32 matrix of normalized embeddings
+        self._results: list = []
+        self._times: list = []  # insertion timestamps, parallel to _results
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Drop all entries (hooked to every save/delete on the store)."""
+        with self._lock:
+            self._vectors = None
+            self._results = []
+            self._times = []
+
+    def search(self, query: str, top_k: int) -> list:
+        vector = np.asarray(_embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+
+        with self._lock:
+            if self._results:
+                sims = self._vectors @ vector
+                best = int(sims.argmax())
+                if sims[best] > self.threshold and time.time() - self._times[best] < self.ttl:
+                    add_debug(f"🔁 Semantic cache hit (similarity={sims[best]:.3f}) for: {query}")
+                    return self._results[best]
+
+        results = search_similar_chunks(query, top_k=top_k)
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = vector[None, :]
+            else:
+                self._vectors = np.vstack([self._vectors, vector])[-self.max_entries:]
+            self._results.append(results)
+            self._times.append(time.time())
+            del self._results[:-self.max_entries]
+            del self._times[:-self.max_entries]
+        return results
+
+_semantic_cache = SemanticCache()
+# Uploads and deletes change what retrieval should return; registering the
+# invalidation keeps milvus_utilis from having to import this module back
+register_mutation_callback(_semantic_cache.clear)
+
+# --- Retrieval Sizing + Reranking ---
+# Retrieve a moderate candidate pool from the vector store, then rerank with a
+# cross-encoder and keep only the best few for the prompt. The previous
+# top_k=300 concatenated every candidate into the LLM context, inflating
+# prompt tokens (and first-token latency) ~20x for no recall benefit.
+RETRIEVAL_TOP_K = 64
+CONTEXT_TOP_K = 8
+
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+
+def _get_cross_encoder():
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _cross_encoder_lock:
+            if _cross_encoder is None:
+                from sentence_transformers import CrossEncoder
+                _cross_encoder = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+    return _cross_encoder
+
+def _rerank(query: str, results: list, keep: int = CONTEXT_TOP_K) -> list:
+    """Keep the `keep` chunks a cross-encoder scores most relevant to the query."""
+    if len(results) <= keep:
+        return results
+    try:
+        scores = _get_cross_encoder().predict([(query, r["chunk"]) for r in results])
+        order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)
+        return [results[i] for i in order[:keep]]
+    except Exception as e:
+        add_debug(f"⚠️ Rerank failed ({e}); keeping vector-store order")
+        return results[:keep]
+
+# --- Semantic Search for Subquestions ---
+def _context_prompt(query: str, context: str, chat_history: str) -> str:
+    return f"""
+CHAT HISTORY:
+{chat_history}
 Based on the following document content, answer this question: {query}
 
 Document content:
@@ -197,7 +608,46 @@ Document content:
 
 Answer the question clearly and concisely using only the information provided above.
 """
-    return ask_llm(prompt)
+
+def ask_llm_with_context(query: str, chat_history: str = "", top_k: int = RETRIEVAL_TOP_K) -> str:
+    results = _semantic_cache.search(query, top_k=top_k)
+    if not results:
+        return "No relevant information found."
+    context = "\n".join([r["chunk"] for r in _rerank(query, results)])
+    return ask_llm(_context_prompt(query, context, chat_history))
+
+async def ask_llm_with_context_async(query: str, client: "httpx.AsyncClient",
+                                     semaphore: asyncio.Semaphore, chat_history: str = "",
+                                     top_k: int = RETRIEVAL_TOP_K) -> str:
+    # The embedding + vector search is sync, so push it off the event loop
+    results = await asyncio.to_thread(_semantic_cache.search, query, top_k)
+    if not results:
+        return "No relevant information found."
+    reranked = await asyncio.to_thread(_rerank, query, results)
+    context = "\n".join([r["chunk"] for r in reranked])
+    return await ask_llm_async(_context_prompt(query, context, chat_history), client, semaphore)
+
+def answer_subquestions(subquestions: list, chat_history: str = "") -> list:
+    """
+    Answer all subquestions concurrently; results come back in subquestion
+    order. The normal path uses asyncio.gather (client and semaphore are
+    created per call because both bind to the event loop asyncio.run spins
+    up); if an event loop is already running on this thread — asyncio.run
+    would raise — a bounded thread pool gives the same fan-out, since
+    requests releases the GIL during network I/O.
+    """
+    async def _fanout():
+        async with httpx.AsyncClient(timeout=LLM_TIMEOUT) as client:
+            semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+            return await asyncio.gather(
+                *[ask_llm_with_context_async(q, client, semaphore, chat_history=chat_history)
+                  for q in subquestions]
+            )
+    try:
+        return asyncio.run(_fanout())
+    except RuntimeError:
+        with ThreadPoolExecutor(max_workers=min(LLM_CONCURRENCY, len(subquestions))) as executor:
+            return list(executor.map(lambda q: ask_llm_with_context(q, chat_history=chat_history), subquestions))
 
 # --- Quality Check for Answers ---
 def check_answers_quality(questions: list, answers: list, original_query: str = "", iteration: int = 1, previous_knowledge_gaps: list = [], max_iterations: int = 3, chat_history: str = "") -> tuple[bool, list]:
@@ -214,10 +664,10 @@ ORIGINAL QUERY: {original_query}
 CURRENT SEARCH ITERATION: {iteration}
 
 SEARCH RESULTS:
-{json.dumps(answers, ensure_ascii=False)}
+{_json_dumps(answers).decode()}
 
 PREVIOUSLY IDENTIFIED LEGAL GAPS:
-{json.dumps(previous_knowledge_gaps, ensure_ascii=False)}
+{_json_dumps(previous_knowledge_gaps).decode()}
 
 INSTRUCTIONS:
 1. Analyze the search results carefully to extract key legal information related to the original query.
@@ -241,14 +691,14 @@ If there are no legal gaps or the research should stop, return an empty array fo
 IMPORTANT: If this is already iteration {max_iterations} or higher, set "search_complete" to true regardless of legal gaps.
 """
     try:
-        response = ask_llm(prompt)
+        response = ask_llm(prompt, model=FAST_MODEL, response_format={"type": "json_object"})
         response = response.strip()
         add_debug(f"🔍 Check answers quality response: {response}")
         start = response.find('{')
         end = response.rfind('}')
         if start != -1 and end != -1 and end > start:
             json_str = response[start:end+1]
-            result = json.loads(json_str)
+            result = _json_loads(json_str)
             accepted = bool(result.get("search_complete", False))
             new_subquestions = result.get("new_queries", []) if not accepted else questions
             return accepted, new_subquestions
@@ -331,10 +781,9 @@ The outline should follow this structure:
         return "(Outline unavailable due to error)"
 
 # --- Final Answer Generation ---
-def generate_final_answer(original_query: str, subquestions: list, answers: list, outline: str, chat_history: str = "") -> str:
-    add_debug("START GENERATING FINAL ANSWER")
+def _final_answer_prompt(original_query: str, subquestions: list, answers: list, outline: str, chat_history: str) -> str:
     search_context = "\n".join([f"Q: {q}\nA: {a}" for q, a in zip(subquestions, answers)])
-    prompt = f"""
+    return f"""
 CHAT HISTORY:
 {chat_history}
 
@@ -369,8 +818,11 @@ IMPORTANT RULES:
 Your expanded answer should be thorough, informative, and directly address the original query,
 while carefully following the outline structure and maintaining strict adherence to the search context.
 """
+
+def generate_final_answer(original_query: str, subquestions: list, answers: list, outline: str, chat_history: str = "") -> str:
+    add_debug("START GENERATING FINAL ANSWER")
     try:
-        answer = ask_llm(prompt)
+        answer = ask_llm(_final_answer_prompt(original_query, subquestions, answers, outline, chat_history))
         add_debug(f"🔍 Final answer: {answer}")
         add_debug("GENERATING FINAL ANSWER DONE")
         return answer.strip()
@@ -378,29 +830,194 @@ while carefully following the outline structure and maintaining strict adherence
         add_debug(f"⚠️ Error in generate_final_answer: {e}")
         return outline + "\n\n" + "\n\n".join(answers)
 
+def generate_final_answer_stream(original_query: str, subquestions: list, answers: list, outline: str, chat_history: str = ""):
+    """Streaming variant of generate_final_answer, yielding text as it arrives."""
+    add_debug("START GENERATING FINAL ANSWER (STREAMING)")
+    yield from ask_llm_stream(_final_answer_prompt(original_query, subquestions, answers, outline, chat_history))
+    add_debug("GENERATING FINAL ANSWER DONE")
+
+# --- Fused Outline + Final Answer ---
+def _fused_outline_answer_prompt(original_query: str, subquestions: list, answers: list, chat_history: str) -> str:
+    search_context = "\n".join([f"Q: {q}\nA: {a}" for q, a in zip(subquestions, answers)])
+    return f"""
+CHAT HISTORY:
+{chat_history}
+
+You are an expert research analyst and content writer. Your task is to answer a query based on search results, in two steps within a single response.
+
+ORIGINAL QUERY: {original_query}
+
+SEARCH CONTEXT (EXPANDED SUBQUESTIONS AND THEIR ANSWERS):
+{search_context}
+
+INSTRUCTIONS:
+First, inside <OUTLINE>...</OUTLINE> tags, write a structured outline for the answer: 5-7 key points, a brief description of the direct answer, and 3-5 main section headings with 2-3 sub-points each.
+Then, inside <ANSWER>...</ANSWER> tags, expand that outline into a comprehensive, detailed answer: turn bullet points into detailed paragraphs, keep the hierarchical structure, include the technical details and examples from the search context, and use an authoritative, clear writing style.
+
+IMPORTANT RULES:
+1. ONLY include information that is directly supported by the search context
+2. DO NOT make up or infer information not present in the search results
+3. If information is missing or unclear, note it as a limitation rather than making assumptions
+4. Use direct quotes from search results when appropriate
+5. Maintain academic rigor and avoid speculation
+
+Respond with exactly the two tagged sections and nothing else.
+"""
+
+def write_outline_and_answer(original_query: str, subquestions: list, answers: list, chat_history: str = "") -> tuple[str, str]:
+    """
+    Produce the outline and the final answer in one LLM call instead of two.
+    Used when the first iteration's answers already pass the quality check and
+    the subquestion list is small — the dependent outline → answer round-trip
+    is the dominant remaining cost at that point. Returns (outline, answer).
+    """
+    add_debug("START FUSED OUTLINE + FINAL ANSWER")
+    try:
+        response = ask_llm(_fused_outline_answer_prompt(original_query, subquestions, answers, chat_history))
+        outline = _extract_tagged(response, "OUTLINE")
+        answer = _extract_tagged(response, "ANSWER")
+        if answer is None:
+            # Model ignored the tags; treat the whole response as the answer
+            outline, answer = "", response
+        add_debug(f"🔍 Outline: {outline}")
+        add_debug(f"🔍 Final answer: {answer}")
+        add_debug("FUSED OUTLINE + FINAL ANSWER DONE")
+        return (outline or "").strip(), answer.strip()
+    except Exception as e:
+        add_debug(f"⚠️ Error in write_outline_and_answer: {e}")
+        return "", "\n\n".join(answers)
+
+def write_outline_and_answer_stream(original_query: str, subquestions: list, answers: list, chat_history: str = ""):
+    """
+    Streaming variant of write_outline_and_answer: the outline section is
+    consumed silently and only the <ANSWER> text is yielded as it arrives.
+    """
+    add_debug("START FUSED OUTLINE + FINAL ANSWER (STREAMING)")
+    open_tag, close_tag = "<ANSWER>", "</ANSWER>"
+    buf = ""
+    in_answer = False
+    for piece in ask_llm_stream(_fused_outline_answer_prompt(original_query, subquestions, answers, chat_history)):
+        buf += piece
+        if not in_answer:
+            idx = buf.find(open_tag)
+            if idx == -1:
+                continue
+            buf = buf[idx + len(open_tag):]
+            in_answer = True
+        end = buf.find(close_tag)
+        if end != -1:
+            if buf[:end]:
+                yield buf[:end]
+            buf = ""
+            break
+        # Hold back a tail shorter than the close tag so a tag split across
+        # two SSE chunks can't leak into the output
+        safe = len(buf) - (len(close_tag) - 1)
+        if safe > 0:
+            yield buf[:safe]
+            buf = buf[safe:]
+    if buf:
+        # Either the model ignored the tags entirely or the stream ended
+        # before the close tag; emit what we have rather than dropping it
+        yield buf
+    add_debug("FUSED OUTLINE + FINAL ANSWER DONE")
+
+def _extract_tagged(text: str, tag: str):
+    """Return the content of <TAG>...</TAG> in text, or None if absent."""
+    start = text.find(f"<{tag}>")
+    if start == -1:
+        return None
+    start += len(tag) + 2
+    end = text.find(f"</{tag}>", start)
+    return text[start:end] if end != -1 else text[start:]
+
+# Precompiled cleanup patterns; one case-insensitive alternation covers both
+# <think> and <THINK> in a single pass instead of two per-call re.sub compiles
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL | re.IGNORECASE)
+_WS_RE = re.compile(r'\n\s*\n')
+
 def clean_llm_response(text: str) -> str:
     """Remove <think>...</think> and <THINK>...</THINK> tags and extra whitespace from LLM output."""
-    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-    text = re.sub(r'<THINK>.*?</THINK>', '', text, flags=re.DOTALL)
-    return text.strip()
+    return _THINK_RE.sub('', text).strip()
 
 # --- Global debug log for Streamlit ---
-debug_log = ""
+# Ring buffer of recent lines: O(1) appends, and the maxlen bound keeps a
+# long-running deployment from growing the log without limit (full LLM
+# responses are logged, so unbounded growth adds up fast)
+debug_log: deque = deque(maxlen=500)
 debug_start_time = None
+# Concurrent subquestion workers all call add_debug; the lock keeps
+# concurrent appends/resets from interleaving badly
+_debug_lock = threading.Lock()
+# stdout can block on pipe back-pressure under some deployments, so the
+# console echo is opt-in; the Streamlit expander reads the buffer directly
+_DEBUG_PRINT = bool(os.environ.get("RAG_DEBUG_PRINT"))
 
 def add_debug(msg: str):
-    global debug_log, debug_start_time
+    global debug_start_time
     if debug_start_time is not None:
         elapsed = time.time() - debug_start_time
     else:
         elapsed = 0.0
-    debug_log += f"[{elapsed:.2f}s] {msg}\n"
-    print(f"[{elapsed:.2f}s] {msg}")
+    with _debug_lock:
+        debug_log.append(f"[{elapsed:.2f}s] {msg}")
+    if _DEBUG_PRINT:
+        print(f"[{elapsed:.2f}s] {msg}")
+
+def get_debug_log() -> str:
+    """Return the accumulated debug log as a single string."""
+    with _debug_lock:
+        return "\n".join(debug_log)
 
 # --- Main Deep Search Pipeline ---
-def deep_search_pipeline(query: str, chat_history: str = "", progress_callback=None) -> str:
-    global debug_log, debug_start_time
-    debug_log = ""
+# Budget for the chat history pasted into every prompt; without a cap the
+# prompt grows quadratically over a long conversation (each turn re-sends all
+# prior turns), and prefill latency grows linearly with input tokens
+_HISTORY_MAX_TOKENS = 1500
+_tiktoken_enc = None
+
+def _truncate_history(history: str, max_tokens: int = _HISTORY_MAX_TOKENS) -> str:
+    """
+    Keep only the most recent part of the chat history, bounded by token
+    count. Uses tiktoken for exact counts when installed, otherwise the
+    ~4-chars-per-token heuristic; either way the cut lands on a line boundary
+    so a Q/A pair isn't split mid-sentence.
+    """
+    global _tiktoken_enc
+    if not history:
+        return history
+    if tiktoken is not None:
+        if _tiktoken_enc is None:
+            _tiktoken_enc = tiktoken.encoding_for_model("gpt-4")
+        tokens = _tiktoken_enc.encode(history)
+        if len(tokens) <= max_tokens:
+            return history
+        truncated = _tiktoken_enc.decode(tokens[-max_tokens:])
+    else:
+        max_chars = max_tokens * 4
+        if len(history) <= max_chars:
+            return history
+        truncated = history[-max_chars:]
+    cut = truncated.find("\n")
+    return truncated[cut + 1:] if cut != -1 else truncated
+
+_NONWORD_RE = re.compile(r"\W+")
+
+def _normalize_query(s: str) -> str:
+    """Collapse case, punctuation and whitespace so near-identical subquestions compare equal."""
+    return _NONWORD_RE.sub(" ", s.lower()).strip()
+
+def _run_research(query: str, chat_history: str = "", progress_callback=None):
+    """
+    Shared front half of the pipeline: query transform, classification +
+    expansion, the iterative answer/quality loop, and the outline. Returns
+    ('direct', prompt) for off-topic queries, otherwise
+    ('research', transformed_query, subquestions, answers, outline) — the
+    caller generates the final answer, either in one shot or streamed.
+    """
+    global debug_start_time
+    with _debug_lock:
+        debug_log.clear()
     debug_start_time = time.time()
     if progress_callback:
         progress_callback(0.01, "Transforming query")
@@ -412,8 +1029,10 @@ def deep_search_pipeline(query: str, chat_history: str = "", progress_callback=N
     add_debug(f"🔍 Transformed query: '{transformed_query}'")
     
     if progress_callback:
-        progress_callback(0.03, "Classifying query")
-    if not is_immigration_related(transformed_query, chat_history=chat_history):
+        progress_callback(0.03, "Classifying and expanding query")
+    # One round-trip answers both "is this on-topic?" and "what should we search?"
+    is_immigration, subquestions = classify_and_expand(transformed_query, chat_history=chat_history)
+    if not is_immigration:
         if progress_callback:
             progress_callback(0.05, "Classifying query")
         prompt = f"""
@@ -427,45 +1046,105 @@ USER QUERY: {transformed_query}
 Please respond accordingly, if the user query is not related to immigration, please let them know.
 """
         add_debug("this use direct answer")
-        direct_answer = ask_llm(prompt)
-        add_debug(f"TOTAL TIME: {time.time() - debug_start_time:.2f}s")
-        if progress_callback:
-            progress_callback(1.0, "Done")
-        return clean_llm_response(direct_answer)
-    
+        return ("direct", prompt)
+
     if progress_callback:
         progress_callback(0.10, "Expanding queries")
-    subquestions = query_expansion(transformed_query, chat_history=chat_history)
     answers = [None] * len(subquestions)
     max_iterations = 3
     previous_knowledge_gaps = []
+    converged_iteration = max_iterations
+    # Normalized text of every subquestion dispatched so far; the quality
+    # check often re-emits near-identical questions across iterations, and
+    # re-answering them wastes a full retrieve + LLM round-trip each
+    seen_subquestions = {_normalize_query(q) for q in subquestions}
     for i in range(max_iterations):
         if progress_callback:
             progress_callback(0.20 + i * 0.20, "Answering queries")
-        answers = []
-        for q in subquestions:
+        # Fan the independent subquestions out concurrently instead of paying
+        # one full LLM round-trip after another
+        answers = answer_subquestions(subquestions, chat_history=chat_history)
+        for q, ans in zip(subquestions, answers):
             add_debug(f"🔍 Subquestion: {q}")
-            ans = ask_llm_with_context(q, chat_history=chat_history)
             add_debug(f"🔍 Answer to subquestion: {ans}")
-            answers.append(ans)
         if progress_callback:
             progress_callback(0.30 + i * 0.20, "Checking answer quality")
         accepted, new_subquestions = check_answers_quality(
             subquestions, answers, original_query=transformed_query, iteration=i + 1, previous_knowledge_gaps=previous_knowledge_gaps, max_iterations=max_iterations, chat_history=chat_history
         )
         if not accepted:
-            previous_knowledge_gaps.extend([q for q in new_subquestions if q not in previous_knowledge_gaps])
-            subquestions = new_subquestions
+            fresh = [q for q in new_subquestions if _normalize_query(q) not in seen_subquestions]
+            if not fresh:
+                add_debug("🔍 Quality check re-emitted only already-answered subquestions — stopping refinement")
+                break
+            seen_subquestions.update(_normalize_query(q) for q in fresh)
+            previous_knowledge_gaps.extend([q for q in fresh if q not in previous_knowledge_gaps])
+            subquestions = fresh
         if accepted:
+            converged_iteration = i + 1
             break
+    # Early convergence on a small question set: the outline and final answer
+    # are fused into a single LLM call downstream, saving one full round-trip
+    if converged_iteration == 1 and len(subquestions) <= 3:
+        add_debug("✅ Converged on iteration 1 — fusing outline and final answer")
+        return ("fused", transformed_query, subquestions, answers)
     if progress_callback:
         progress_callback(0.80, "Writing outline")
     outline = write_outline(transformed_query, subquestions, answers, chat_history=chat_history)
-    if progress_callback:
-        progress_callback(0.90, "Generating answer")
-    final_answer = generate_final_answer(transformed_query, subquestions, answers, outline, chat_history=chat_history)
+    return ("research", transformed_query, subquestions, answers, outline)
+
+def _finish_pipeline(progress_callback=None):
+    """Shared bookkeeping once the final answer has been produced."""
     add_debug(f"TOTAL TIME: {time.time() - debug_start_time:.2f}s")
     if progress_callback:
         progress_callback(1.0, "Done")
     print("DEEP SEARCH DONE")
+
+def deep_search_pipeline(query: str, chat_history: str = "", progress_callback=None) -> str:
+    """
+    Run the deep search pipeline and return the complete final answer.
+    """
+    # Truncate once at the entry point; every prompt in the pipeline —
+    # including the final-answer call below — pastes this string verbatim
+    chat_history = _truncate_history(chat_history)
+    result = _run_research(query, chat_history=chat_history, progress_callback=progress_callback)
+    if result[0] == "direct":
+        final_answer = ask_llm(result[1])
+    elif result[0] == "fused":
+        _, transformed_query, subquestions, answers = result
+        if progress_callback:
+            progress_callback(0.90, "Generating answer")
+        _, final_answer = write_outline_and_answer(transformed_query, subquestions, answers, chat_history=chat_history)
+    else:
+        _, transformed_query, subquestions, answers, outline = result
+        if progress_callback:
+            progress_callback(0.90, "Generating answer")
+        final_answer = generate_final_answer(transformed_query, subquestions, answers, outline, chat_history=chat_history)
+    _finish_pipeline(progress_callback)
     return clean_llm_response(final_answer)
+
+def deep_search_pipeline_stream(query: str, chat_history: str = "", progress_callback=None):
+    """
+    Streaming variant of deep_search_pipeline: the research phase runs as
+    usual, but the final answer is yielded chunk by chunk as the LLM produces
+    it, so the UI can render text immediately instead of waiting for the last
+    (and longest) LLM call to finish.
+    """
+    # Truncate once at the entry point; every prompt in the pipeline —
+    # including the streamed final-answer call below — pastes this string
+    # verbatim
+    chat_history = _truncate_history(chat_history)
+    result = _run_research(query, chat_history=chat_history, progress_callback=progress_callback)
+    if result[0] == "direct":
+        yield from ask_llm_stream(result[1])
+    elif result[0] == "fused":
+        _, transformed_query, subquestions, answers = result
+        if progress_callback:
+            progress_callback(0.90, "Generating answer")
+        yield from write_outline_and_answer_stream(transformed_query, subquestions, answers, chat_history=chat_history)
+    else:
+        _, transformed_query, subquestions, answers, outline = result
+        if progress_callback:
+            progress_callback(0.90, "Generating answer")
+        yield from generate_final_answer_stream(transformed_query, subquestions, answers, outline, chat_history=chat_history)
+    _finish_pipeline(progress_callback)
@@ -5,6 +5,7 @@ AI Document Assistant - Streamlit Web Interface
 
 import streamlit as st
 import os
+import re
 import sys
 import tempfile
 from pathlib import Path
@@ -15,10 +16,6 @@ from typing import List, Dict, Optional
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from core.rag_chain import deep_search_pipeline, debug_log
-from core.milvus_utilis import save_to_chromadb, search_similar_chunks, delete_file, delete_all, collection
-from core.embedding import split_into_chunks
-
 # Set Streamlit to run on port 8686
 st.set_page_config(
     page_title="AI Immigration Lawyer Assistant",
@@ -29,6 +26,64 @@ st.set_page_config(
 
 os.environ["STREAMLIT_SERVER_PORT"] = "8686"
 
+# Precompiled cleanup patterns shared by the memory class and the chat loop;
+# a single case-insensitive pattern covers <think> and <THINK> in one pass
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL | re.IGNORECASE)
+_WS_RE = re.compile(r'\n\s*\n')
+
+_THINK_OPEN = "<think>"
+_THINK_CLOSE = "</think>"
+
+def _filter_think_stream(stream):
+    """
+    Drop <think>…</think> blocks from a token stream as it is yielded, so
+    reasoning text never reaches the page — matching what clean_llm_response
+    does for the non-streamed pipeline. Holds back just enough of the tail
+    that a tag split across stream chunks can't leak through.
+    """
+    in_think = False
+    buf = ""
+    for piece in stream:
+        buf += piece
+        while True:
+            lowered = buf.lower()
+            if in_think:
+                idx = lowered.find(_THINK_CLOSE)
+                if idx == -1:
+                    # Discard thinking text, keeping only a possible partial
+                    # close tag at the tail
+                    buf = buf[-(len(_THINK_CLOSE) - 1):]
+                    break
+                buf = buf[idx + len(_THINK_CLOSE):]
+                in_think = False
+            else:
+                idx = lowered.find(_THINK_OPEN)
+                if idx == -1:
+                    # Emit all but a possible partial open tag at the tail
+                    keep = len(_THINK_OPEN) - 1
+                    if len(buf) > keep:
+                        yield buf[:-keep]
+                        buf = buf[-keep:]
+                    break
+                if idx:
+                    yield buf[:idx]
+                buf = buf[idx + len(_THINK_OPEN):]
+                in_think = True
+    if not in_think and buf:
+        yield buf
+
+@st.cache_resource(show_spinner="🔄 Loading AI models...")
+def _load_backend():
+    """
+    Import the heavy backend (ChromaDB client, embedding model, RAG chain)
+    once per server process. Keeping these imports out of module scope lets
+    the chat UI paint immediately on cold start instead of waiting seconds
+    for model load; cache_resource shares the loaded modules across reruns
+    and sessions.
+    """
+    from core import milvus_utilis, rag_chain
+    return rag_chain, milvus_utilis
+
 class StreamlitConversationMemory:
     """Manages conversation history for the Streamlit app"""
     
@@ -48,14 +103,8 @@ class StreamlitConversationMemory:
         
     def _clean_answer(self, answer: str) -> str:
         """Remove thinking tags and clean up the answer"""
-        import re
-        # Remove thinking tags and content
-        answer = re.sub(r'<think>.*?</think>', '', answer, flags=re.DOTALL)
-        answer = re.sub(r'<THINK>.*?</THINK>', '', answer, flags=re.DOTALL)
-        # Clean up extra whitespace
-        answer = re.sub(r'\n\s*\n', '\n\n', answer)
-        answer = answer.strip()
-        return answer
+        # Remove thinking tags and content, then collapse extra whitespace
+        return _WS_RE.sub('\n\n', _THINK_RE.sub('', answer)).strip()
         
     def get_context_summary(self) -> str:
         """Get a summary of recent conversation for context"""
@@ -102,13 +151,16 @@ def process_document(file_path: str, filename: str) -> bool:
         st.error(f"❌ No text extracted from {filename}")
         return False
     
+    _, store = _load_backend()
+    from core.embedding import split_into_chunks
+
     # Split into chunks
     chunks = split_into_chunks(text)
     st.success(f"📄 Extracted {len(chunks)} chunks from {filename}")
-    
+
     # Save to ChromaDB
     try:
-        save_to_chromadb(chunks, filename)
+        store.save_to_chromadb(chunks, filename)
         st.success(f"✅ Successfully processed {filename}")
         return True
     except Exception as e:
@@ -118,14 +170,10 @@ def process_document(file_path: str, filename: str) -> bool:
 def get_document_list():
     """Get list of documents in the database"""
     try:
-        collection.load()
-        results = collection.query(
-            expr="",
-            output_fields=["filename"],
-            limit=1000
-        )
-        filenames = list(set([r["filename"] for r in results]))
-        return filenames
+        # Served from the sidecar filename index instead of scanning the
+        # collection, so re-rendering the sidebar doesn't hit the vector DB
+        _, store = _load_backend()
+        return store.list_filenames()
     except Exception as e:
         st.error(f"❌ Error listing documents: {e}")
         return []
@@ -176,23 +224,42 @@ def main():
                 if msg["role"] == "user":
                     chat_history.append(f"Q{q_num}: {msg['content']}")
                 else:
-                    # Clean answer of <think> tags
-                    import re
-                    cleaned = re.sub(r'<think>.*?</think>', '', msg['content'], flags=re.DOTALL)
-                    cleaned = re.sub(r'<THINK>.*?</THINK>', '', cleaned, flags=re.DOTALL)
-                    cleaned = cleaned.strip()
+                    # Answers are cleaned once at insertion time; the fallback
+                    # only runs for messages from older sessions
+                    cleaned = msg.get('cleaned')
+                    if cleaned is None:
+                        cleaned = _THINK_RE.sub('', msg['content']).strip()
                     chat_history.append(f"A{q_num}: {cleaned}")
                     q_num += 1
             context = "\n".join(chat_history)
-            answer = deep_search_pipeline(user_input, chat_history=context, progress_callback=progress_callback)
+            # Stream the final answer into the page as the LLM produces it;
+            # write_stream returns the concatenated text for the history
+            st.markdown("<div style='text-align: left;'><b>🤖 Assistant:</b></div>", unsafe_allow_html=True)
+            rag, _ = _load_backend()
+            answer = st.write_stream(_filter_think_stream(
+                rag.deep_search_pipeline_stream(user_input, chat_history=context, progress_callback=progress_callback)
+            ))
         progress_bar.empty()
-        st.session_state.chat_history.append({"role": "assistant", "content": answer})
+        # The stream is already think-free; one final pass catches anything
+        # the chunk filter couldn't (e.g. an unterminated block), and the
+        # cleaned text is what gets rendered on every rerun
+        cleaned_answer = _THINK_RE.sub('', answer).strip()
+        st.session_state.chat_history.append({
+            "role": "assistant",
+            "content": cleaned_answer,
+            "cleaned": cleaned_answer
+        })
         st.rerun()
 
-    # Always show the debug log after the chat interface (no progress bar here)
-    if debug_log.strip():
-        with st.expander("🧠 Show LLM Thinking / Debug Output"):
-            st.code(debug_log)
+    # Show the debug log after the chat interface (no progress bar here).
+    # Gated on existing chat history so the first paint of an idle page never
+    # triggers the backend import
+    if st.session_state.chat_history:
+        rag, _ = _load_backend()
+        debug_text = rag.get_debug_log()
+        if debug_text.strip():
+            with st.expander("🧠 Show LLM Thinking / Debug Output"):
+                st.code(debug_text)
 
 if __name__ == "__main__":
     main() 
@@ -4,46 +4,38 @@ Test script to find optimal chunk size and overlap for immigration law document
 """
 
 import time
-from core.embedding import split_into_chunks
+import numpy as np
+from core.embedding import split_text_recursive, token_length
 from core.milvus_utilis import search_similar_chunks
 
 def test_chunk_configurations():
     """Test different chunk configurations and measure performance"""
-    
+
     # Read a sample of the document
     print("📖 Reading immigration law document sample...")
     with open("full_immigration_law.txt", "r", encoding="utf-8") as f:
         text = f.read(50000)  # Read first 50KB for testing
-    
+
     print(f"📄 Sample text length: {len(text)} characters")
-    
-    # Test configurations
+
+    # Token-budget configurations with 15% overlap: sizes are in embedding
+    # tokens so chunks stay inside the embedder's context window instead of
+    # being silently truncated at embed time
     configurations = [
-        (200, 20),   # Small chunks, small overlap
-        (300, 50),   # Current configuration
-        (400, 80),   # Larger chunks, more overlap
-        (500, 100),  # Even larger chunks
-        (600, 120),  # Large chunks
-        (800, 160),  # Very large chunks
-        (1000, 200), # Extra large chunks
+        (128, int(128 * 0.15)),  # Small chunks
+        (256, int(256 * 0.15)),  # Medium chunks
+        (512, int(512 * 0.15)),  # Full embedder context
     ]
-    
+
     results = []
-    
+
     for chunk_size, overlap in configurations:
-        print(f"\n🧪 Testing: chunk_size={chunk_size}, overlap={overlap}")
-        
-        # Update the configuration temporarily
-        import core.embedding
-        original_chunk_size = core.embedding.CHUNK_SIZE
-        original_overlap = core.embedding.CHUNK_OVERLAP
-        
-        core.embedding.CHUNK_SIZE = chunk_size
-        core.embedding.CHUNK_OVERLAP = overlap
-        
-        # Time the chunking process
+        print(f"\n🧪 Testing: chunk_size={chunk_size} tokens, overlap={overlap} tokens")
+
+        # Time the chunking process (configuration is passed in directly,
+        # no module-attribute mutation)
         start_time = time.time()
-        chunks = split_into_chunks(text)
+        chunks = split_text_recursive(text, chunk_size=chunk_size, chunk_overlap=overlap)
         chunking_time = time.time() - start_time
         
         print(f"   📊 Generated {len(chunks)} chunks in {chunking_time:.2f}s")
@@ -55,14 +47,18 @@ def test_chunk_configurations():
         results_search = search_similar_chunks(test_query, top_k=5)
         search_time = time.time() - start_time
         
-        # Analyze chunk quality
-        avg_chunk_length = sum(len(chunk) for chunk in chunks) / len(chunks)
-        min_chunk_length = min(len(chunk) for chunk in chunks)
-        max_chunk_length = max(len(chunk) for chunk in chunks)
-        
-        # Check if chunks contain complete sentences
-        complete_sentences = sum(1 for chunk in chunks if chunk.strip().endswith(('.', '!', '?')))
-        sentence_completeness = complete_sentences / len(chunks) * 100
+        # Analyze chunk quality (lengths measured in tokens, same unit as the
+        # chunking budget); numpy reductions instead of four Python loops
+        chunk_lengths = np.fromiter((token_length(chunk) for chunk in chunks),
+                                    dtype=np.int32, count=len(chunks))
+        avg_chunk_length = float(chunk_lengths.mean())
+        min_chunk_length = int(chunk_lengths.min())
+        max_chunk_length = int(chunk_lengths.max())
+
+        # Check if chunks contain complete sentences (vectorized over the
+        # array of last characters)
+        last_chars = np.array([chunk.strip()[-1] if chunk.strip() else '' for chunk in chunks])
+        sentence_completeness = float(np.isin(last_chars, list('.!?')).mean() * 100)
         
         result = {
             'chunk_size': chunk_size,
@@ -80,14 +76,11 @@ def test_chunk_configurations():
         results.append(result)
         
         print(f"   ⏱️  Chunking: {chunking_time:.2f}s, Search: {search_time:.2f}s")
-        print(f"   📏 Avg chunk length: {avg_chunk_length:.0f} chars")
+        print(f"   📏 Avg chunk length: {avg_chunk_length:.0f} tokens")
         print(f"   📝 Sentence completeness: {sentence_completeness:.1f}%")
         print(f"   🎯 Top result score: {result['top_result_score']:.3f}")
-        
-        # Restore original configuration
-        core.embedding.CHUNK_SIZE = original_chunk_size
-        core.embedding.CHUNK_OVERLAP = original_overlap
-    
+
+
     # Find optimal configuration
     print(f"\n🎯 ANALYSIS RESULTS:")
     print("=" * 80)
@@ -119,14 +112,14 @@ def test_chunk_configurations():
     print(f"\n💡 RECOMMENDATIONS:")
     print("=" * 80)
     
-    if best_balanced['chunk_size'] != 300 or best_balanced['overlap'] != 50:
-        print(f"🔄 Consider updating current settings ({300}/{50}) to {best_balanced['chunk_size']}/{best_balanced['overlap']}")
+    if best_balanced['chunk_size'] != 256 or best_balanced['overlap'] != int(256 * 0.15):
+        print(f"🔄 Consider updating default settings ({256}/{int(256 * 0.15)} tokens) to {best_balanced['chunk_size']}/{best_balanced['overlap']}")
         print(f"   Expected improvements:")
         print(f"   - Search relevance: {best_balanced['top_result_score']:.3f} vs current")
         print(f"   - Sentence completeness: {best_balanced['sentence_completeness']:.1f}%")
         print(f"   - Processing time: {best_balanced['chunking_time']:.2f}s")
     else:
-        print(f"✅ Current configuration ({300}/{50}) appears optimal!")
+        print(f"✅ Default configuration ({256}/{int(256 * 0.15)} tokens) appears optimal!")
     
     # Show top 3 configurations
     print(f"\n🏅 TOP 3 CONFIGURATIONS:")
@@ -4,12 +4,21 @@ AI-Powered Web Crawler for AI Document Assistant
 Uses LLM to intelligently navigate websites and process content before database storage
 """
 
+import asyncio
+import httpx
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+import gzip
+import hashlib
+import itertools
+import numpy as np
+import sqlite3
+import threading
 import time
 import os
 import re
 import json
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urljoin, urlparse
 from pathlib import Path
 import argparse
@@ -21,108 +30,580 @@ from config.config import LLM_API_KEY, LLM_API_URL
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# lxml is a C parser, several times faster than the pure-Python html.parser
+# on USCIS-sized pages; fall back gracefully when it isn't installed
+try:
+    import lxml  # noqa: F401
+    _BS_PARSER = "lxml"
+except ImportError:
+    _BS_PARSER = "html.parser"
+
+# Tokenizer used only to compute logit-bias token ids for single-token
+# YES/NO replies; without it the bias hint is simply skipped
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# orjson (C implementation) when available, stdlib json otherwise — same
+# optional-dependency pattern as core/rag_chain.py
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _json_dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode()
+
+def _json_loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Parse-only filter for link extraction: builds just the anchor nodes instead
+# of the whole tree
+_LINK_STRAINER = SoupStrainer("a", href=True)
+
+# Phrases whose presence marks a page as pure navigation/boilerplate. Compiled
+# into a single alternation so the prefilter is one linear scan over the page
+# instead of one full `in` scan per phrase
+_SKIP_PHRASES = (
+    'rss feed', 'was this page helpful', 'yes no', 'select a reason',
+    'how can the content be improved', 'skip to main content',
+    'official government website', 'secure website', 'español',
+    'multilingual resources', 'sign in', 'create account',
+    'menu', 'close menu', 'breadcrumb', 'return to top',
+    'facebook', 'twitter', 'youtube', 'instagram', 'linkedin',
+    'email', 'contact uscis', 'privacy policy', 'terms of use',
+    'accessibility', 'freedom of information act', 'no fear act',
+    'inspector general', 'white house', 'usa.gov', 'vote.gov'
+)
+# Case-insensitive so the hot path can scan the raw content once instead of
+# first allocating a lowercased copy of the whole page
+_SKIP_PHRASE_RE = re.compile("|".join(re.escape(p) for p in _SKIP_PHRASES), re.IGNORECASE)
+
+# clean_content patterns, compiled once at import instead of on every page
+_BOILERPLATE_RE = re.compile(
+    r'(Skip to main content|U\.S\. flag|Official Government Website|Secure Website|Español|Multilingual Resources|Sign In|Create Account|Menu|Close menu|Breadcrumb|Return to top|Facebook|X, formerly known as Twitter|YouTube|Instagram|LinkedIn|Email|Contact USCIS|U\.S\. Department of Homeland Security Seal|Agency description|Important links|Looking for U\.S\. government information and services\?|Visit USA\.gov|Was this page helpful\?|Yes|No|This page was not helpful because the content|Select a reason|has too little information|has too much information|is confusing|is out of date|other|How can the content be improved\?|To protect your privacy, please do not include any personal information in your feedback|Review our Privacy Policy|RSS Feed|Subscribe|Follow us|Share this page|Print this page|Download|PDF|Word|Excel|PowerPoint|Accessibility|Privacy Policy|Terms of Use|Freedom of Information Act|No Fear Act|Inspector General|White House|USA\.gov|Vote\.gov)',
+    re.IGNORECASE
+)
+_NUM_LINE_RE = re.compile(r'^[\d\s\-\.]+$')
+_NAV_LINE_RE = re.compile(r'^(Home|About|Contact|Help|Search|Menu|Close|Back|Next|Previous)$', re.IGNORECASE)
+
+# Shared relevance rubric used by both the single-page and batched prompts
+_RELEVANCE_RUBRIC = """You are an expert immigration lawyer. Determine if a webpage contains SUBSTANTIVE legal information that would help you guide a client through the US citizenship process.
+
+ONLY answer YES if the page contains:
+- Specific legal requirements, procedures, or eligibility criteria
+- Immigration law statutes, regulations, or policy guidance
+- Step-by-step instructions for forms or processes
+- Legal definitions, interpretations, or clarifications
+- Official policy memos, field guidance, or legal precedents
+- Specific eligibility requirements, time periods, or qualifications
+- Legal consequences, penalties, or rights
+- Official procedures, timelines, or processes
+
+Answer NO if the page contains:
+- General information, news, or announcements
+- Navigation menus, feedback forms, or website features
+- Contact information, office locations, or administrative details
+- General descriptions without specific legal content
+- Links pages, sitemaps, or organizational information
+- Social media, accessibility, or website policy information"""
+
+# Statute/regulation citation forms (8 U.S.C., 8 CFR, INA §, Pub. L.): a page
+# quoting these is substantive legal content without needing the LLM to say so
+_LEGAL_CITATION_RE = re.compile(
+    r"\b(?:\d+\s+U\.?S\.?C\.?|\d+\s+C\.?F\.?R\.?|Pub\.?\s*L\.?)\b|\bINA\s*§"
+)
+
+# Parses numbered YES/NO answer lines from a batched relevance response
+_BATCH_ANSWER_RE = re.compile(r'^\s*(\d+)\s*[.):]?\s*(YES|NO)', re.MULTILINE | re.IGNORECASE)
+
+# Link substrings we never crawl; one compiled scan per URL instead of seven
+# Python-level substring searches per anchor
+_SKIP_LINK_RE = re.compile(r"javascript:|mailto:|tel:|#|/search|/contact|/feedback", re.IGNORECASE)
+
+# Elements and selectors used when parsing a page; module scope so the parser
+# is a plain function usable from any worker
+_NON_CONTENT_ELEMENTS = [
+    "script", "style", "nav", "footer", "header", "aside",
+    "form", "button", "input", "select", "textarea",
+    ".breadcrumb", ".navigation", ".menu", ".sidebar",
+    ".social-media", ".feedback", ".help", ".contact",
+    ".accessibility", ".privacy", ".terms", ".sitemap"
+]
+_CONTENT_SELECTORS = [
+    'main', 'article', '[role="main"]', '.content', '.main-content',
+    '#content', '#main', '.usa-main-content', '.usa-content',
+    '.usa-layout-docs__main', '.usa-layout-docs__content',
+    '.usa-section', '.usa-grid', '.usa-width-one-whole',
+    '.usa-width-two-thirds', '.usa-width-one-half'
+]
+# One combined selector: a single soup.select() walk instead of ~15
+_CONTENT_SELECTOR = ", ".join(_CONTENT_SELECTORS)
+
+def _clean_content(content: str) -> str:
+    """Clean and organize extracted page content"""
+    if not content:
+        return ""
+
+    # Remove extra whitespace and normalize; str.split/join do this at C
+    # speed without spinning up the regex engine on the whole document
+    content = ' '.join(content.split())
+
+    # Remove common navigation and non-content text
+    content = _BOILERPLATE_RE.sub('', content)
+
+    # Remove very short lines that are likely navigation
+    lines = [line.strip() for line in content.split('\n') if len(line.strip()) > 20]
+
+    # Remove lines that are just punctuation, numbers, or navigation
+    lines = [line for line in lines if not _NUM_LINE_RE.match(line)]
+    lines = [line for line in lines if not _NAV_LINE_RE.match(line)]
+
+    return '\n'.join(lines)
+
+def _collect_links(anchors, url: str, base_domain: str) -> set:
+    """Resolve and filter same-domain links from a list of anchor tags."""
+    links = set()
+    for link in anchors:
+        full_url = urljoin(url, link['href'])
+        if urlparse(full_url).netloc == base_domain:
+            if not _SKIP_LINK_RE.search(full_url):
+                links.add(full_url)
+    return links
+
+def _parse_page(html: str, url: str, base_domain: str) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Parse one fetched page into (page_data, links) in a single pass, so each
+    URL is downloaded and parsed exactly once. Module-level plain function:
+    no crawler state needed, which also keeps it usable from worker pools.
+    """
+    soup = BeautifulSoup(html, _BS_PARSER)
+
+    # Collect same-domain links before pruning, since navigation elements
+    # carry many of them
+    links = _collect_links(soup.find_all('a', href=True), url, base_domain)
+
+    # Share of visible text that lives inside anchors: link farms and
+    # navigation hubs score high, prose pages low. Measured before pruning
+    # so the density reflects the page as served
+    anchor_chars = sum(len(a.get_text(strip=True)) for a in soup.find_all('a'))
+    page_chars = len(soup.get_text(strip=True))
+    link_density = anchor_chars / page_chars if page_chars else 1.0
+
+    # Remove non-content elements
+    for element in soup(_NON_CONTENT_ELEMENTS):
+        element.decompose()
+
+    # Extract title
+    title = ""
+    title_tag = soup.find('title')
+    if title_tag:
+        title = title_tag.get_text().strip()
+
+    # Extract content from main areas with better targeting
+    content_parts = []
+    for element in soup.select(_CONTENT_SELECTOR):
+        text = element.get_text().strip()
+        if text and len(text) > 100:  # Only substantial content
+            content_parts.append(text)
+
+    # If no main content found, try paragraphs and headings
+    if not content_parts:
+        for p in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li']):
+            text = p.get_text().strip()
+            if text and len(text) > 50:  # Only meaningful content
+                content_parts.append(text)
+
+    # Fallback to body content
+    if not content_parts:
+        body = soup.find('body')
+        if body:
+            content_parts.append(body.get_text())
+
+    page_data = {
+        'title': title,
+        'content': _clean_content('\n\n'.join(content_parts)),
+        'link_density': round(link_density, 3),
+        'url': url
+    }
+    return page_data, sorted(links)
+
+class LLMCache:
+    """
+    Persistent exact-match cache for LLM responses, keyed on a SHA-256 of the
+    model + prompt. Re-crawls ask the same relevance questions about mostly
+    unchanged pages, and each repeat hit skips a multi-second GPT-4
+    round-trip. Entries expire after `ttl` seconds so stale verdicts age out.
+    """
+
+    def __init__(self, path, ttl: int = 86400):
+        self.path = str(path)
+        self.ttl = ttl
+        self._local = threading.local()  # SQLite connections are per-thread
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, created_at REAL)"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key_for(model: str, prompt: str, system: str = "") -> str:
+        if orjson is not None:
+            raw = orjson.dumps({"model": model, "prompt": prompt, "system": system},
+                               option=orjson.OPT_SORT_KEYS)
+        else:
+            raw = json.dumps({"model": model, "prompt": prompt, "system": system},
+                             sort_keys=True).encode()
+        return hashlib.sha256(raw).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row and time.time() - row[1] < self.ttl:
+            return row[0]
+        return None
+
+    def set(self, key: str, response: str):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+            (key, response, time.time())
+        )
+        conn.commit()
+
+class CrawlStore:
+    """
+    Persistent per-URL crawl state: HTTP validators, content hash, relevance
+    verdict, cleaned content and discovered links. Re-runs revalidate pages
+    with cheap conditional GETs and reuse stored verdicts for unchanged
+    content instead of refetching and reclassifying the whole site.
+    """
+
+    def __init__(self, path: Path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT,
+                    relevant INTEGER,
+                    title TEXT,
+                    content TEXT,
+                    links TEXT,
+                    fetched_at REAL
+                )"""
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, url: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT etag, last_modified, content_hash, relevant, title, content, links "
+            "FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'etag': row[0],
+            'last_modified': row[1],
+            'content_hash': row[2],
+            'relevant': bool(row[3]),
+            'title': row[4],
+            'content': row[5],
+            'links': _json_loads(row[6]) if row[6] else [],
+        }
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str],
+            content_hash: str, relevant: bool, title: str, content: str,
+            links: List[str]):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO pages "
+            "(url, etag, last_modified, content_hash, relevant, title, content, links, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, content_hash, int(relevant), title,
+             content, _json_dumps(links).decode(), time.time())
+        )
+        conn.commit()
+
+# Sentinel returned by _fetch when the server answers 304 Not Modified
+_NOT_MODIFIED = object()
+
 class AIContentProcessor:
     """AI-powered content filtering only (no summarization or restructuring)"""
-    
-    def __init__(self):
+
+    # Cosine similarity above which two page snippets are treated as the same
+    # page for relevance purposes (USCIS templates share heavy boilerplate)
+    SEMANTIC_THRESHOLD = 0.92
+    # Max pages judged in one batched relevance prompt
+    BATCH_SIZE = 8
+
+    def __init__(self, cache_dir: Optional[Path] = None, model: str = "gpt-4o-mini"):
         self.api_url = LLM_API_URL
         self.api_key = LLM_API_KEY
-    
-    def ask_llm(self, prompt: str) -> str:
-        """Send a prompt to the LLM"""
+        # YES/NO relevance is binary classification; the small model is
+        # plenty for it and far cheaper/faster than gpt-4
+        self.model = model
+        # Logit bias pinning single-page relevance replies to the YES/NO
+        # tokens; decode cost is linear in output tokens, so capping the
+        # reply at one token removes nearly all of it
+        self._yes_no_bias: Optional[Dict[str, int]] = None
+        if tiktoken is not None:
+            try:
+                enc = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                enc = tiktoken.get_encoding("cl100k_base")
+            yes_ids, no_ids = enc.encode("YES"), enc.encode("NO")
+            if len(yes_ids) == 1 and len(no_ids) == 1:
+                self._yes_no_bias = {str(yes_ids[0]): 100, str(no_ids[0]): 100}
+        self.cache = LLMCache(Path(cache_dir) / ".llm_cache.db") if cache_dir else None
+        self.stats = {"hits": 0, "misses": 0, "semantic_hits": 0, "local_hits": 0}
+        # Semantic near-duplicate cache for relevance verdicts: normalized
+        # snippet embeddings as rows of a matrix, verdicts in a parallel list.
+        # The embedder itself loads lazily on first use
+        self._embedder = None
+        self.cache_vecs = np.empty((0, 384), dtype=np.float32)
+        self.cache_labels: List[bool] = []
+        # Relevance checks can run from several worker threads at once
+        self._semantic_lock = threading.Lock()
+
+    def _get_embedder(self):
+        if self._embedder is None:
+            from sentence_transformers import SentenceTransformer
+            self._embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        return self._embedder
+
+    def _semantic_lookup(self, title: str, content: str):
+        """
+        Return (verdict, vector) where verdict is a cached bool when a prior
+        snippet is within SEMANTIC_THRESHOLD cosine similarity, else None.
+        """
+        vector = self._get_embedder().encode(
+            f"{title}\n{content[:1500]}", normalize_embeddings=True
+        ).astype(np.float32)
+        with self._semantic_lock:
+            if self.cache_vecs.size:
+                sims = self.cache_vecs @ vector
+                best = int(np.argmax(sims))
+                if sims[best] > self.SEMANTIC_THRESHOLD:
+                    return self.cache_labels[best], vector
+        return None, vector
+
+    def _semantic_store(self, vector: np.ndarray, verdict: bool):
+        with self._semantic_lock:
+            self.cache_vecs = np.vstack([self.cache_vecs, vector])
+            self.cache_labels.append(verdict)
+
+    def _local_verdict(self, content: str, link_density: Optional[float] = None) -> Optional[bool]:
+        """
+        Settle the obvious tails locally: pages quoting statute citations are
+        substantive (YES), pages that are mostly link text are navigation
+        hubs (NO). Returns None for the ambiguous middle, which goes to the
+        LLM as before.
+        """
+        if len(content) > 500 and _LEGAL_CITATION_RE.search(content):
+            return True
+        if link_density is not None and link_density > 0.4:
+            return False
+        return None
+
+    def ask_llm(self, prompt: str, max_tokens: Optional[int] = None,
+                logit_bias: Optional[Dict[str, int]] = None,
+                system: str = "You are a helpful assistant.") -> str:
+        """
+        Send a prompt to the LLM (served from the local cache when possible).
+        Static instructions belong in `system`: the provider caches shared
+        prompt prefixes server-side, so keeping the big rubric identical
+        across calls and only varying the small user message cuts prefill
+        latency and cost.
+        """
+        model = self.model
+        if self.cache is not None:
+            key = LLMCache.key_for(model, prompt, system)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return cached
         payload = {
-            "model": "gpt-4",
+            "model": model,
             "messages": [
-                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "system", "content": system},
                 {"role": "user", "content": prompt}
             ]
         }
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        if logit_bias:
+            payload["logit_bias"] = logit_bias
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
-        response = requests.post(self.api_url, json=payload, headers=headers)
+
+        # Pre-serialized body: orjson beats the stdlib encoder requests
+        # would use via json=, and the saving compounds across calls
+        response = requests.post(self.api_url, data=_json_dumps(payload), headers=headers)
         response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        content = _json_loads(response.content)["choices"][0]["message"]["content"]
+        if self.cache is not None:
+            self.stats["misses"] += 1
+            self.cache.set(key, content)
+        return content
     
-    def is_page_relevant(self, url: str, title: str, content: str, target_domain: str) -> bool:
+    def is_page_relevant(self, url: str, title: str, content: str, target_domain: str,
+                         link_density: Optional[float] = None) -> bool:
         """
         Use AI to determine if a page contains substantive immigration law knowledge.
-        Returns True only if the content contains actual legal information, procedures, 
+        Returns True only if the content contains actual legal information, procedures,
         or guidance that would be useful for immigration lawyers helping citizenship applicants.
         """
         try:
             # First, do a quick content check to filter out obvious non-content
-            content_lower = content.lower()
-            if any(skip in content_lower for skip in [
-                'rss feed', 'was this page helpful', 'yes no', 'select a reason',
-                'how can the content be improved', 'skip to main content',
-                'official government website', 'secure website', 'español',
-                'multilingual resources', 'sign in', 'create account',
-                'menu', 'close menu', 'breadcrumb', 'return to top',
-                'facebook', 'twitter', 'youtube', 'instagram', 'linkedin',
-                'email', 'contact uscis', 'privacy policy', 'terms of use',
-                'accessibility', 'freedom of information act', 'no fear act',
-                'inspector general', 'white house', 'usa.gov', 'vote.gov'
-            ]):
+            if _SKIP_PHRASE_RE.search(content):
                 return False
-            
+
             # Check if content is too short or seems like navigation
             if len(content.strip()) < 200:
                 return False
-            
-            prompt = f"""
-            You are an expert immigration lawyer. Determine if this webpage contains SUBSTANTIVE legal information that would help you guide a client through the US citizenship process.
-
-            ONLY answer YES if the page contains:
-            - Specific legal requirements, procedures, or eligibility criteria
-            - Immigration law statutes, regulations, or policy guidance
-            - Step-by-step instructions for forms or processes
-            - Legal definitions, interpretations, or clarifications
-            - Official policy memos, field guidance, or legal precedents
-            - Specific eligibility requirements, time periods, or qualifications
-            - Legal consequences, penalties, or rights
-            - Official procedures, timelines, or processes
-
-            Answer NO if the page contains:
-            - General information, news, or announcements
-            - Navigation menus, feedback forms, or website features
-            - Contact information, office locations, or administrative details
-            - General descriptions without specific legal content
-            - Links pages, sitemaps, or organizational information
-            - Social media, accessibility, or website policy information
-
-            URL: {url}
-            Title: {title}
-            Content Preview: {content[:1500]}...
-
-            Answer only YES or NO:
-            """
-            
-            response = self.ask_llm(prompt)
+
+            # Obvious cases settle locally — no embedding, no LLM
+            local = self._local_verdict(content, link_density)
+            if local is not None:
+                self.stats["local_hits"] += 1
+                return local
+
+            # Near-duplicate of an already-judged page (template reuse):
+            # reuse its verdict instead of paying another LLM call
+            cached_verdict, vector = self._semantic_lookup(title, content)
+            if cached_verdict is not None:
+                self.stats["semantic_hits"] += 1
+                logger.info(f"♻️ Semantic cache hit for {url}: {'YES' if cached_verdict else 'NO'}")
+                return cached_verdict
+
+            # Rubric goes in the system message so the provider's prefix
+            # cache amortizes it; only this small part varies per page
+            prompt = f"""URL: {url}
+Title: {title}
+Content Preview: {content[:1500]}...
+
+Answer only YES or NO:
+"""
+
+            # Single-token reply: prefill dominates, decode cost ~vanishes
+            response = self.ask_llm(prompt, max_tokens=1,
+                                    logit_bias=self._yes_no_bias,
+                                    system=_RELEVANCE_RUBRIC)
             answer = response.strip().lower()
-            return answer.startswith("yes")
-            
+            verdict = answer.startswith("yes")
+            self._semantic_store(vector, verdict)
+            return verdict
+
         except Exception as e:
             logger.error(f"❌ AI relevance check failed: {e}")
             return False
 
+    def is_batch_relevant(self, items: List[Tuple]) -> List[bool]:
+        """
+        Judge several pages with one LLM call instead of one call each,
+        amortizing the HTTP round-trip and the repeated rubric tokens. Each
+        item is (url, title, content) or (url, title, content, link_density);
+        the cheap prefilters, the local citation/link-density classifier and
+        the semantic cache settle what they can first, and only the undecided
+        pages go into the numbered batch prompt.
+        """
+        verdicts: List[Optional[bool]] = [None] * len(items)
+        pending = []  # (item index, url, title, content, snippet vector)
+        for idx, item in enumerate(items):
+            url, title, content = item[0], item[1], item[2]
+            link_density = item[3] if len(item) > 3 else None
+            if _SKIP_PHRASE_RE.search(content) or len(content.strip()) < 200:
+                verdicts[idx] = False
+                continue
+            local = self._local_verdict(content, link_density)
+            if local is not None:
+                self.stats["local_hits"] += 1
+                verdicts[idx] = local
+                continue
+            cached_verdict, vector = self._semantic_lookup(title, content)
+            if cached_verdict is not None:
+                self.stats["semantic_hits"] += 1
+                verdicts[idx] = cached_verdict
+                continue
+            pending.append((idx, url, title, content, vector))
+
+        for start in range(0, len(pending), self.BATCH_SIZE):
+            chunk = pending[start:start + self.BATCH_SIZE]
+            try:
+                answers = self._ask_batch(chunk)
+            except Exception as e:
+                # Fail closed for this batch, but don't poison the semantic
+                # cache with verdicts the model never actually gave
+                logger.error(f"❌ AI batch relevance check failed: {e}")
+                for idx, url, title, content, vector in chunk:
+                    verdicts[idx] = False
+                continue
+            for (idx, url, title, content, vector), verdict in zip(chunk, answers):
+                self._semantic_store(vector, verdict)
+                verdicts[idx] = verdict
+        return [bool(v) for v in verdicts]
+
+    def _ask_batch(self, chunk: list) -> List[bool]:
+        """One numbered multi-page prompt; answers parsed line by line."""
+        entries = []
+        for n, (idx, url, title, content, vector) in enumerate(chunk, 1):
+            entries.append(f"Page {n}:\nURL: {url}\nTitle: {title}\nContent Preview: {content[:1500]}...")
+        prompt = f"""For each of the following {len(chunk)} pages, answer YES or NO on its own line, numbered to match (e.g. "1. YES"). Answer with only the numbered lines.
+
+{chr(10).join(entries)}
+"""
+        response = self.ask_llm(prompt, system=_RELEVANCE_RUBRIC)
+        answer_by_number = {int(num): ans.upper() == "YES"
+                            for num, ans in _BATCH_ANSWER_RE.findall(response)}
+        # Missing or malformed lines default to NO rather than guessing YES
+        return [answer_by_number.get(n, False) for n in range(1, len(chunk) + 1)]
+
 class AIWebCrawler:
-    def __init__(self, output_dir: str = "crawled_data", delay: float = 2.0, max_pages: int = 30):
+    # Per-page body cap: pages larger than this (giant PDFs, generated HTML)
+    # are skipped instead of buffered whole in memory
+    MAX_BYTES = 2 * 1024 * 1024
+
+    def __init__(self, output_dir: str = "crawled_data", delay: float = 2.0, max_pages: int = 30,
+                 concurrency: int = 5):
         """
         Initialize the AI-powered web crawler
-        
+
         Args:
             output_dir: Directory to save processed content
-            delay: Delay between requests in seconds
+            delay: Delay between requests in seconds (per worker)
             max_pages: Maximum number of pages to crawl
+            concurrency: Number of pages fetched/filtered in parallel
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         self.delay = delay
         self.max_pages = max_pages
-        self.ai_processor = AIContentProcessor()
+        self.concurrency = concurrency
+        self.ai_processor = AIContentProcessor(cache_dir=self.output_dir)
+        self.store = CrawlStore(self.output_dir / "crawl.db")
         
         self.session = requests.Session()
         self.session.headers.update({
@@ -136,177 +617,268 @@ class AIWebCrawler:
         
         self.visited_urls: Set[str] = set()
         self.processed_pages: List[Dict] = []
-        self.crawl_queue: List[Tuple[str, float]] = []  # (url, priority)
-        
+
+
+    def _fetch_html(self, url: str) -> str:
+        """
+        Fetch a page body with streaming, bailing out as soon as the declared
+        or actual size exceeds MAX_BYTES, so one oversized page can neither
+        blow up memory nor dominate bandwidth.
+        """
+        with self.session.get(url, timeout=20, stream=True) as response:
+            response.raise_for_status()
+            declared = int(response.headers.get('Content-Length') or 0)
+            if declared > self.MAX_BYTES:
+                raise ValueError(f"page too large ({declared} bytes > {self.MAX_BYTES} cap)")
+            body = bytearray()
+            for block in response.iter_content(65536):
+                body.extend(block)
+                if len(body) > self.MAX_BYTES:
+                    raise ValueError(f"page too large (> {self.MAX_BYTES} bytes cap)")
+            return body.decode(response.encoding or 'utf-8', errors='replace')
+
+    def fetch_page(self, url: str, base_domain: str = None) -> Tuple[Dict[str, str], List[str]]:
+        """
+        Fetch a URL once and return both its content and its same-domain
+        links, so callers that need both don't download and parse the page
+        twice.
+        """
+        try:
+            logger.info(f"📄 Crawling: {url}")
+            html = self._fetch_html(url)
+            page_data, links = _parse_page(html, url, base_domain or urlparse(url).netloc)
+            return page_data, links
+        except Exception as e:
+            logger.error(f"❌ Error fetching {url}: {e}")
+            return {'title': '', 'content': '', 'url': url}, []
+
     def extract_page_content(self, url: str) -> Dict[str, str]:
         """Extract raw content from a webpage with better organization"""
         try:
             logger.info(f"📄 Crawling: {url}")
-            response = self.session.get(url, timeout=20)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove more non-content elements
-            for element in soup([
-                "script", "style", "nav", "footer", "header", "aside",
-                "form", "button", "input", "select", "textarea",
-                ".breadcrumb", ".navigation", ".menu", ".sidebar",
-                ".social-media", ".feedback", ".help", ".contact",
-                ".accessibility", ".privacy", ".terms", ".sitemap"
-            ]):
-                element.decompose()
-            
-            # Extract title
-            title = ""
-            title_tag = soup.find('title')
-            if title_tag:
-                title = title_tag.get_text().strip()
-            
-            # Extract content from main areas with better targeting
-            content_selectors = [
-                'main', 'article', '[role="main"]', '.content', '.main-content',
-                '#content', '#main', '.usa-main-content', '.usa-content',
-                '.usa-layout-docs__main', '.usa-layout-docs__content',
-                '.usa-section', '.usa-grid', '.usa-width-one-whole',
-                '.usa-width-two-thirds', '.usa-width-one-half'
-            ]
-            
-            content_parts = []
-            for selector in content_selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    text = element.get_text().strip()
-                    if text and len(text) > 100:  # Only substantial content
-                        content_parts.append(text)
-            
-            # If no main content found, try paragraphs and headings
-            if not content_parts:
-                paragraphs = soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'])
-                for p in paragraphs:
-                    text = p.get_text().strip()
-                    if text and len(text) > 50:  # Only meaningful content
-                        content_parts.append(text)
-            
-            # Fallback to body content
-            if not content_parts:
-                body = soup.find('body')
-                if body:
-                    content_parts.append(body.get_text())
-            
-            raw_content = '\n\n'.join(content_parts)
-            
-            # Clean up the content
-            raw_content = self.clean_content(raw_content)
-            
-            return {
-                'title': title,
-                'content': raw_content,
-                'url': url
-            }
-            
+            html = self._fetch_html(url)
+            page_data, _ = _parse_page(html, url, urlparse(url).netloc)
+            return page_data
+
         except Exception as e:
             logger.error(f"❌ Error extracting content from {url}: {e}")
             return {'title': '', 'content': '', 'url': url}
-    
+
     def clean_content(self, content: str) -> str:
         """Clean and organize the extracted content"""
-        if not content:
-            return ""
-        
-        # Remove extra whitespace and normalize
-        content = re.sub(r'\s+', ' ', content.strip())
-        
-        # Remove common navigation and non-content text
-        content = re.sub(r'(Skip to main content|U\.S\. flag|Official Government Website|Secure Website|Español|Multilingual Resources|Sign In|Create Account|Menu|Close menu|Breadcrumb|Return to top|Facebook|X, formerly known as Twitter|YouTube|Instagram|LinkedIn|Email|Contact USCIS|U\.S\. Department of Homeland Security Seal|Agency description|Important links|Looking for U\.S\. government information and services\?|Visit USA\.gov|Was this page helpful\?|Yes|No|This page was not helpful because the content|Select a reason|has too little information|has too much information|is confusing|is out of date|other|How can the content be improved\?|To protect your privacy, please do not include any personal information in your feedback|Review our Privacy Policy|RSS Feed|Subscribe|Follow us|Share this page|Print this page|Download|PDF|Word|Excel|PowerPoint|Accessibility|Privacy Policy|Terms of Use|Freedom of Information Act|No Fear Act|Inspector General|White House|USA\.gov|Vote\.gov)', '', content, flags=re.IGNORECASE)
-        
-        # Remove very short lines that are likely navigation
-        lines = [line.strip() for line in content.split('\n') if len(line.strip()) > 20]
-        
-        # Remove lines that are just punctuation, numbers, or navigation
-        lines = [line for line in lines if not re.match(r'^[\d\s\-\.]+$', line)]
-        lines = [line for line in lines if not re.match(r'^(Home|About|Contact|Help|Search|Menu|Close|Back|Next|Previous)$', line, re.IGNORECASE)]
-        
-        return '\n'.join(lines)
-    
+        return _clean_content(content)
+
     def extract_links(self, url: str, base_domain: str) -> List[str]:
         """Extract links from a page"""
         try:
-            response = self.session.get(url, timeout=20)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            links = []
-            
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                full_url = urljoin(url, href)
-                
-                if urlparse(full_url).netloc == base_domain:
-                    if not any(skip in full_url.lower() for skip in [
-                        'javascript:', 'mailto:', 'tel:', '#', '/search', '/contact', '/feedback'
-                    ]):
-                        links.append(full_url)
-            
-            return list(set(links))
-            
+            html = self._fetch_html(url)
+
+            # Only anchor nodes get built; no full DOM for a links-only pass
+            soup = BeautifulSoup(html, _BS_PARSER, parse_only=_LINK_STRAINER)
+            return sorted(_collect_links(soup.find_all('a', href=True), url, base_domain))
+
         except Exception as e:
             logger.error(f"❌ Error extracting links from {url}: {e}")
             return []
-    
+
+    async def _fetch(self, client: "httpx.AsyncClient", semaphore: asyncio.Semaphore,
+                     url: str, cached: Optional[Dict] = None) -> Tuple[object, Optional[str], Optional[str]]:
+        """
+        Fetch one page; the semaphore bounds concurrent requests and the
+        per-slot delay keeps the crawl polite without stalling the whole loop.
+        When a stored entry provides validators, the GET is conditional and a
+        304 comes back as (_NOT_MODIFIED, None, None). Otherwise returns
+        (html or None, etag, last_modified).
+        """
+        try:
+            headers = {}
+            if cached:
+                if cached['etag']:
+                    headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    headers['If-Modified-Since'] = cached['last_modified']
+            async with semaphore:
+                logger.info(f"📄 Crawling: {url}")
+                async with client.stream("GET", url, timeout=20,
+                                         headers=headers or None) as response:
+                    if response.status_code == 304:
+                        logger.info(f"♻️ Not modified: {url}")
+                        return _NOT_MODIFIED, None, None
+                    response.raise_for_status()
+                    declared = int(response.headers.get('Content-Length') or 0)
+                    if declared > self.MAX_BYTES:
+                        logger.warning(f"⏭️ Skipping {url}: {declared} bytes exceeds cap")
+                        return None, None, None
+                    body = bytearray()
+                    async for block in response.aiter_bytes(65536):
+                        body.extend(block)
+                        if len(body) > self.MAX_BYTES:
+                            logger.warning(f"⏭️ Skipping {url}: body exceeds {self.MAX_BYTES} bytes cap")
+                            return None, None, None
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                html = bytes(body).decode(response.encoding or 'utf-8', errors='replace')
+                return html, response.headers.get('ETag'), response.headers.get('Last-Modified')
+        except Exception as e:
+            logger.error(f"❌ Error fetching {url}: {e}")
+            return None, None, None
+
+    async def _crawl_async(self, start_url: str, base_domain: str):
+        """
+        Worker-pool crawl: each URL is fetched once, parsed once into content
+        and links, and the LLM relevance check runs off the event loop so
+        fetches and filters for different pages overlap. All frontier and
+        visited-set mutations happen on the single event loop, so no locking
+        is needed.
+        """
+        # Heap-ordered frontier (asyncio.PriorityQueue is heapq-backed):
+        # O(log N) push/pop instead of re-sorting a list per pop. Entries are
+        # (-priority, counter, url) — negated priority makes the min-heap pop
+        # highest priority first, and the monotonic counter breaks ties so
+        # equal-priority URLs come out in insertion order without comparing
+        # the strings
+        frontier: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        counter = itertools.count()
+        frontier.put_nowait((-10.0, next(counter), start_url))
+        self.visited_urls.add(start_url)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # Relevance checks from all workers funnel through one batcher so
+        # several pages share a single LLM call
+        relevance_queue: asyncio.Queue = asyncio.Queue()
+
+        async def relevance_batcher():
+            while True:
+                first = await relevance_queue.get()
+                batch = [first]
+                # Brief window to let concurrently fetched pages join the batch
+                while len(batch) < AIContentProcessor.BATCH_SIZE:
+                    try:
+                        batch.append(await asyncio.wait_for(relevance_queue.get(), timeout=0.25))
+                    except asyncio.TimeoutError:
+                        break
+                items = [(url, title, content, density)
+                         for url, title, content, density, _ in batch]
+                try:
+                    results = await asyncio.to_thread(self.ai_processor.is_batch_relevant, items)
+                except Exception as e:
+                    logger.error(f"❌ Batched relevance check failed: {e}")
+                    results = [False] * len(batch)
+                for (_, _, _, _, future), verdict in zip(batch, results):
+                    if not future.done():
+                        future.set_result(verdict)
+
+        # BeautifulSoup parsing is CPU-bound and holds the GIL, so it runs in
+        # a process pool: pages parse in parallel across cores while fetches
+        # stay on the event loop. _parse_page is a module-level function, so
+        # it pickles cleanly into the workers
+        loop = asyncio.get_running_loop()
+        parse_pool = ProcessPoolExecutor(
+            max_workers=min(os.cpu_count() or 1, self.concurrency)
+        )
+
+        async with httpx.AsyncClient(headers=dict(self.session.headers),
+                                     follow_redirects=True) as client:
+
+            async def worker():
+                while True:
+                    _neg_priority, _, url = await frontier.get()
+                    try:
+                        if len(self.processed_pages) >= self.max_pages:
+                            continue
+                        cached = self.store.get(url)
+                        html, etag, last_modified = await self._fetch(client, semaphore, url, cached)
+                        if html is _NOT_MODIFIED:
+                            # Unchanged since the last run: reuse the stored
+                            # verdict, content and links — no parse, no LLM
+                            title, content = cached['title'], cached['content']
+                            links, is_relevant = cached['links'], cached['relevant']
+                        elif html is None:
+                            continue
+                        else:
+                            page_data, links = await loop.run_in_executor(
+                                parse_pool, _parse_page, html, url, base_domain
+                            )
+                            title, content = page_data['title'], page_data['content']
+                            if not content or len(content) < 100:
+                                continue
+                            content_hash = hashlib.sha256(content.encode()).hexdigest()
+                            if cached and cached['content_hash'] == content_hash:
+                                # Body refetched but text unchanged (e.g. no
+                                # validators, or only chrome changed)
+                                is_relevant = cached['relevant']
+                            else:
+                                # AI relevance filter only
+                                logger.info(f"🤖 AI filtering: {title[:50]}...")
+                                future = asyncio.get_running_loop().create_future()
+                                relevance_queue.put_nowait(
+                                    (url, title, content,
+                                     page_data.get('link_density'), future)
+                                )
+                                is_relevant = await future
+                            self.store.put(url, etag, last_modified, content_hash,
+                                           is_relevant, title, content, links)
+                        if is_relevant and len(self.processed_pages) < self.max_pages:
+                            self.processed_pages.append({
+                                'title': title,
+                                'url': url,
+                                'content': content
+                            })
+                            logger.info(f"✅ Kept relevant page {len(self.processed_pages)}/{self.max_pages}: {title[:50]}...")
+                            # Queue this page's links for further crawling
+                            if len(self.processed_pages) < self.max_pages:
+                                for link in links:
+                                    if link not in self.visited_urls:
+                                        self.visited_urls.add(link)
+                                        frontier.put_nowait((-5.0, next(counter), link))
+                    except Exception as e:
+                        logger.error(f"❌ Error crawling {url}: {e}")
+                    finally:
+                        frontier.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            batcher = asyncio.create_task(relevance_batcher())
+            await frontier.join()
+            for task in workers + [batcher]:
+                task.cancel()
+            await asyncio.gather(*workers, batcher, return_exceptions=True)
+        parse_pool.shutdown()
+
     def intelligent_crawl(self, start_url: str, site_name: str) -> List[Dict]:
         """
         Perform AI-powered intelligent crawling, but only filter for relevance (no summarization)
         """
         logger.info(f"🧠 Starting AI-powered intelligent crawl of {site_name} (filter only, no summarization)")
-        
+
         base_domain = urlparse(start_url).netloc
-        self.crawl_queue = [(start_url, 10.0)]  # Start with high priority
-        
-        while self.crawl_queue and len(self.processed_pages) < self.max_pages:
-            self.crawl_queue.sort(key=lambda x: x[1], reverse=True)
-            current_url, priority = self.crawl_queue.pop(0)
-            if current_url in self.visited_urls:
-                continue
-            self.visited_urls.add(current_url)
-            # Extract raw content
-            page_data = self.extract_page_content(current_url)
-            if not page_data['content'] or len(page_data['content']) < 100:
-                continue
-            # AI relevance filter only
-            logger.info(f"🤖 AI filtering: {page_data['title'][:50]}...")
-            is_relevant = self.ai_processor.is_page_relevant(
-                current_url, page_data['title'], page_data['content'], base_domain
-            )
-            if is_relevant:
-                self.processed_pages.append({
-                    'title': page_data['title'],
-                    'url': page_data['url'],
-                    'content': page_data['content']
-                })
-                logger.info(f"✅ Kept relevant page {len(self.processed_pages)}/{self.max_pages}: {page_data['title'][:50]}...")
-                # Get and prioritize links for further crawling
-                if len(self.processed_pages) < self.max_pages:
-                    links = self.extract_links(current_url, base_domain)
-                    if links:
-                        # Use AI to prioritize links (optional, or just add all)
-                        for link in links:
-                            if link not in self.visited_urls:
-                                self.crawl_queue.append((link, 5.0))
-            # Rate limiting
-            time.sleep(self.delay)
+        asyncio.run(self._crawl_async(start_url, base_domain))
+
         logger.info(f"🎯 AI-powered crawl completed: {len(self.processed_pages)} relevant pages processed")
+        stats = self.ai_processor.stats
+        logger.info(f"🧮 LLM cache: {stats['hits']} hits, {stats['misses']} misses, "
+                    f"{stats['semantic_hits']} semantic hits, {stats['local_hits']} local verdicts")
         return self.processed_pages
     
-    def save_processed_content(self, pages: List[Dict], site_name: str) -> str:
-        """Save only the full, original content of relevant pages"""
+    def save_processed_content(self, pages: List[Dict], site_name: str,
+                               compress: bool = False) -> Tuple[str, int]:
+        """
+        Save only the full, original content of relevant pages. Streams pages
+        to disk in one pass, counting content characters as they are written
+        so callers don't need a second walk over the corpus. With compress=True
+        the file is gzip-compressed (.txt.gz) — note the upload path only
+        accepts plain .txt/.md, so the default stays uncompressed.
+        """
         if not pages:
             logger.warning(f"⚠️ No relevant content to save for {site_name}")
-            return ""
+            return "", 0
         timestamp = time.strftime("%Y%m%d_%H%M%S")
         txt_filename = f"{site_name}_relevant_fulltext_{timestamp}.txt"
+        if compress:
+            txt_filename += ".gz"
         txt_filepath = self.output_dir / txt_filename
-        with open(txt_filepath, 'w', encoding='utf-8') as f:
+        opener = (lambda p: gzip.open(p, 'wt', encoding='utf-8', compresslevel=3)) \
+            if compress else (lambda p: open(p, 'w', encoding='utf-8'))
+        total_chars = 0
+        with opener(txt_filepath) as f:
             f.write(f"# Full Original Content of Relevant Pages\n")
             f.write(f"# Source: {site_name}\n")
             f.write(f"# Processed on: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
@@ -315,24 +887,26 @@ class AIWebCrawler:
                 f.write(f"## Page {i}: {page['title']}\n")
                 f.write(f"URL: {page['url']}\n")
                 f.write("-" * 80 + "\n")
-                f.write(page['content'])
+                total_chars += f.write(page['content'])
                 f.write("\n\n" + "=" * 80 + "\n\n")
         logger.info(f"💾 Saved {len(pages)} relevant pages to {txt_filepath}")
-        return str(txt_filepath)
+        return str(txt_filepath), total_chars
 
 def main():
     parser = argparse.ArgumentParser(description="AI-Powered Web Crawler for Immigration Law Content")
     parser.add_argument("--output", "-o", default="crawled_data", help="Output directory")
     parser.add_argument("--delay", "-d", type=float, default=2.0, help="Delay between requests (seconds)")
     parser.add_argument("--max-pages", "-m", type=int, default=30, help="Maximum pages to crawl")
-    
+    parser.add_argument("--concurrency", "-c", type=int, default=5, help="Concurrent page fetches")
+
     args = parser.parse_args()
-    
+
     # Initialize AI crawler
     crawler = AIWebCrawler(
         output_dir=args.output,
         delay=args.delay,
-        max_pages=args.max_pages
+        max_pages=args.max_pages,
+        concurrency=args.concurrency
     )
     
     # USCIS Laws and Policy URL
@@ -347,9 +921,8 @@ def main():
         pages = crawler.intelligent_crawl(uscis_url, site_name)
         
         if pages:
-            filepath = crawler.save_processed_content(pages, site_name)
-            total_chars = sum(len(page['content']) for page in pages)
-            
+            filepath, total_chars = crawler.save_processed_content(pages, site_name)
+
             logger.info(f"✅ AI-powered crawl completed successfully!")
             logger.info(f"📈 Results: {len(pages)} pages, {total_chars:,} characters")
             logger.info(f"💾 RAG-ready content saved to: {filepath}")